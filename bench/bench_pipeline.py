@@ -0,0 +1,197 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from fixtures import fixtures, watchlist
+
+import stock_runner  # noqa: E402
+import snapshot  # noqa: E402
+import analytics  # noqa: E402
+import symbols  # noqa: E402
+from quotes import QuoteTable  # noqa: E402
+from servers import Servers  # noqa: E402
+
+SIZES = (10, 100, 1000, 10000)
+
+
+def timeit(fn, repeat, number=1):
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        samples.append((time.perf_counter() - start) / number)
+    return samples
+
+
+def result(stage, provider, size, samples):
+    return {
+        "stage": stage,
+        "provider": provider,
+        "size": size,
+        "min_us": round(min(samples) * 1e6, 2),
+        "median_us": round(statistics.median(samples) * 1e6, 2),
+        "per_symbol_ns": round(min(samples) * 1e9 / size, 2),
+    }
+
+
+def config(indices):
+    return {
+        "indices": indices,
+        "threshold": {"indices": [2] * len(indices), "up": 7, "down": 5},
+        "delay": 6,
+        "rest_dates": [],
+    }
+
+
+def bench(size, repeat):
+    indices, codes = watchlist(size)
+    _, _, cases = fixtures(size)
+    results = []
+
+    for server in Servers:
+        name = server["name"]
+
+        def convert():
+            for i in indices:
+                server["code_converter"](i, True)
+            for i in codes:
+                server["code_converter"](i)
+
+        results.append(result("code_converter", name, size, timeit(convert, repeat)))
+
+        view, rsp = cases[name]
+        table = QuoteTable(view["codes"], short=view["has_price"])
+        for parser in ("rsp_parser", "rsp_bytes_parser"):
+            for price in (True, None):
+                stage = f"{parser}{'[price]' if price else ''}"
+                samples = timeit(lambda: view[parser](rsp, view, price, table), repeat)
+                results.append(result(stage, name, size, samples))
+
+    # Shared stages run on the parsed data of the first provider
+    view, rsp = cases[Servers[0]["name"]]
+    stock_runner.Config = config(indices)
+    stock_runner.Server = dict(view, has_name=False)
+    stock_runner.Keys = symbols.resolve(indices, codes, [dict(s) for s in Servers])
+    prices = QuoteTable(stock_runner.Keys)
+    view["rsp_parser"](rsp, view, None, prices)
+    placeholders = QuoteTable(stock_runner.Keys)
+
+    symbols.learn(stock_runner.Keys, prices.names)
+    stock_runner.Rules = None
+    results.append(
+        result("fill_names", "-", size, timeit(lambda: stock_runner.fillNames(placeholders), repeat))
+    )
+
+    stock_runner.checkNotify(prices)  # Compiles the rules
+
+    def notify():
+        stock_runner.Rules.reset()
+        stock_runner.checkNotify(prices)
+
+    results.append(result("check_notify", "-", size, timeit(notify, repeat)))
+
+    if analytics.numpy:
+        rolling = analytics.Rolling(stock_runner.Keys, 6)
+        clock = [0.0]
+
+        def analyse():
+            clock[0] += 6
+            rolling.update(prices, clock[0])
+
+        results.append(result("analytics", "-", size, timeit(analyse, repeat, 20)))
+
+    with tempfile.TemporaryFile("w+", encoding="utf-8") as fData:
+        jsonData = {"notified": [], "prices": prices}
+        writer = snapshot.Writer(fData)
+
+        def base():
+            writer.write({"seq": writer.seq + 1, "base": jsonData}, jsonData)
+
+        results.append(result("write_base", "-", size, timeit(base, repeat)))
+
+        # A few quotes move per tick on a typical day
+        moved = prices.copy()
+        for i in range(0, size, 20):
+            moved.setValue(i, None)
+
+        def delta():
+            writer.data = None
+            writer.publish(jsonData)
+            start = time.perf_counter()
+            writer.publish({"notified": [], "prices": moved})
+            return time.perf_counter() - start
+
+        samples = [delta() for _ in range(repeat)]
+        results.append(result("write_delta", "-", size, samples))
+    return results
+
+
+def version():
+    try:
+        return subprocess.check_output(
+            ["git", "describe", "--always", "--dirty"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            text=True,
+            stderr=subprocess.DEVNULL,
+        ).strip()
+    except Exception:
+        return None
+
+
+def compare(results, baseline, tolerance):
+    base = {(r["stage"], r["provider"], r["size"]): r["min_us"] for r in baseline["results"]}
+    regressions = []
+    for r in results:
+        old = base.get((r["stage"], r["provider"], r["size"]))
+        if old and r["min_us"] > old * (1 + tolerance):
+            regressions.append({**r, "baseline_us": old})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the runner pipeline stages")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--out", help="Write the JSON report to this file")
+    parser.add_argument("--baseline", help="A previous JSON report to compare with")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    stock_runner.log = lambda msg: None
+    stock_runner.toast = lambda txts, img=None: None  # Alerts are not under test
+
+    results = []
+    for size in args.sizes:
+        results += bench(size, args.repeat)
+        print(f"size {size} done", file=sys.stderr)
+
+    report = {
+        "version": version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": round(time.time()),
+        "results": results,
+    }
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            report["regressions"] = compare(results, json.load(f), args.tolerance)
+
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get("regressions"):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,114 @@
+import json
+import random
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "plugin"))
+
+from servers import Servers  # noqa: E402
+
+INDICES = ["000001", "399001", "399006", "899050", "000985", "HSI"]
+NAMES = ["上证指数", "深证成指", "创业板指", "北证50", "中证全指", "恒生指数", "万科Ａ", "平安银行", "贵州茅台"]
+ENCODINGS = {"qq": "gbk", "sina": "gbk", "sohu": "gbk"}
+
+
+class FakeResponse:
+    def __init__(self, content, encoding):
+        self.content = content
+        self.encoding = encoding
+        self.apparent_encoding = encoding
+        self.status_code = 200
+
+    @property
+    def text(self):
+        return self.content.decode(self.encoding)
+
+
+def watchlist(size, seed=0):
+    rnd = random.Random(seed)
+    codes = set()
+    while len(codes) < max(size - len(INDICES), 0):
+        codes.add(f"{rnd.choice((0, 1, 3, 6, 8))}{rnd.randint(0, 99999):05d}")
+    return INDICES[:size], sorted(codes)
+
+
+def symbols(server, indices, codes):
+    return [server["code_converter"](i, True) for i in indices] + [
+        server["code_converter"](i) for i in codes
+    ]
+
+
+def _quote(rnd):
+    return round(rnd.uniform(1, 4000), 2), round(rnd.uniform(-10, 10), 2)
+
+
+def _qq(syms, rnd):
+    lines = []
+    for i, sym in enumerate(syms):
+        price, pct = _quote(rnd)
+        fields = ["0"] * 50
+        fields[0], fields[1], fields[2], fields[3] = "1", NAMES[i % len(NAMES)], sym[-6:], str(price)
+        fields[30], fields[32] = "20250123150003", str(pct)
+        lines.append(f'v_{sym}="{"~".join(fields)}";')
+    return "\n".join(lines) + "\n"
+
+
+def _sina(syms, rnd):
+    lines = []
+    for i, sym in enumerate(syms):
+        price, pct = _quote(rnd)
+        name = NAMES[i % len(NAMES)]
+        if sym.startswith("rt_hk"):
+            fields = [sym[5:], name, "1", "2", "3", "4", str(price), "7", str(pct), "9", "10"]
+        else:
+            fields = [name, str(price), "1.23", str(pct), "100", "200"]
+        lines.append(f'var hq_str_{sym}="{",".join(fields)}";')
+    return "\n".join(lines) + "\n"
+
+
+def _east(syms, rnd):
+    diff = []
+    for i, _ in enumerate(syms):
+        price, pct = _quote(rnd)
+        diff.append({"f2": price, "f3": pct, "f14": NAMES[i % len(NAMES)], "f124": 1737615603})
+    body = json.dumps({"rc": 0, "data": {"total": len(diff), "diff": diff}}, ensure_ascii=False)
+    return f"qa_wap_jsonpCB1737645019281({body});"
+
+
+def _xq(syms, rnd):
+    data = []
+    for sym in syms:
+        price, pct = _quote(rnd)
+        data.append({"symbol": sym, "current": price, "percent": pct, "chg": 1.2, "timestamp": 1737615603000})
+    return json.dumps({"data": data, "error_code": 0, "error_description": None})
+
+
+def _cls(syms, rnd):
+    return json.dumps({"code": 200, "data": {sym: _quote(rnd)[1] / 100 for sym in syms}, "msg": ""})
+
+
+def _sohu(syms, rnd):
+    items = []
+    for i, sym in enumerate(syms):
+        price, pct = _quote(rnd)
+        items.append([sym, NAMES[i % len(NAMES)], str(price), f"{pct}%"] if sym else [])
+    return f"PEAK_ODIA({json.dumps(['x', *items], ensure_ascii=False)});\n"
+
+
+GENERATORS = {"qq": _qq, "sina": _sina, "east": _east, "xq": _xq, "cls": _cls, "sohu": _sohu}
+
+
+# Synthetic response of `server` for the given provider symbols
+def response(server, syms, seed=0):
+    encoding = ENCODINGS.get(server["name"], "utf-8")
+    text = GENERATORS[server["name"]](syms, random.Random(seed))
+    return FakeResponse(text.encode(encoding), encoding)
+
+
+def fixtures(size, seed=0):
+    indices, codes = watchlist(size, seed)
+    result = {}
+    for server in Servers:
+        syms = symbols(server, indices, codes)
+        result[server["name"]] = (dict(server, codes=syms, codes_str=",".join(syms)), response(server, syms, seed))
+    return indices, codes, result
@@ -0,0 +1,67 @@
+import argparse
+import sys
+
+from fixtures import ENCODINGS, FakeResponse, fixtures
+
+from quotes import QuoteTable  # noqa: E402
+from servers import Servers  # noqa: E402
+
+# Checks that the bytes parser of every provider fills the same quotes and
+# source_ts as its text parser, on synthetic responses of several sizes and
+# seeds, with and without price mode:
+#   python parity.py --sizes 10 1000 --seeds 0 1 2
+
+SIZES = (10, 100, 1000)
+# GBK trail byte of 亊 is `~`, the field separator of qq
+TILDE_NAMES = {"万科Ａ": "亊科Ａ"}
+
+
+# The same response with names whose bytes may be taken for separators
+def tricky(rsp, name):
+    encoding = ENCODINGS.get(name)
+    if not encoding:
+        return None
+    content = rsp.content
+    for old, new in TILDE_NAMES.items():
+        content = content.replace(old.encode(encoding), new.encode(encoding))
+    return FakeResponse(content, encoding) if content != rsp.content else None
+
+
+def parse(view, parser, rsp, price):
+    table = QuoteTable(view["codes"], short=view["has_price"])
+    view = dict(view)
+    count = view[parser](rsp, view, price, table)
+    return count, table.rows(), view.get("source_ts")
+
+
+def check(size, seed):
+    mismatches = []
+    _, _, cases = fixtures(size, seed)
+    for server in Servers:
+        name = server["name"]
+        view, rsp = cases[name]
+        for rsp in filter(None, (rsp, tricky(rsp, name))):
+            for price in (True, None):
+                text = parse(view, "rsp_parser", rsp, price)
+                raw = parse(view, "rsp_bytes_parser", rsp, price)
+                if text != raw:
+                    mismatches.append({"provider": name, "size": size, "seed": seed, "price": price})
+    return mismatches
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the bytes and text parsers of every provider")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES)
+    parser.add_argument("--seeds", type=int, nargs="+", default=[0, 1, 2])
+    args = parser.parse_args()
+
+    mismatches = [m for size in args.sizes for seed in args.seeds for m in check(size, seed)]
+    for m in mismatches:
+        print(f"Mismatch: {m}", file=sys.stderr)
+    print(f"{len(args.sizes) * len(args.seeds)} watchlists, {len(mismatches)} mismatches")
+    if mismatches:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import argparse
+import io
+import json
+import os
+import platform
+import shutil
+import statistics
+import tempfile
+import time
+
+# The runner writes under ~/.stock, a replay gets its own
+HOME = tempfile.mkdtemp(prefix="stock-replay-")
+os.environ["HOME"] = os.environ["USERPROFILE"] = HOME
+os.makedirs(os.path.join(HOME, ".stock", "cfg"))
+
+from fixtures import watchlist  # noqa: E402
+from stub_server import StubServer, arguments, faults  # noqa: E402
+from bench_pipeline import version  # noqa: E402
+
+import stock_runner  # noqa: E402
+import metrics  # noqa: E402
+import pubsub  # noqa: E402
+import recorder  # noqa: E402
+import sessions  # noqa: E402
+import snapshot  # noqa: E402
+from servers import Servers  # noqa: E402
+
+# Replays a capture, or a synthetic watchlist, against the local stub server
+# through retrieveStockData, checkNotify and the publish path of the runner,
+# as fast as possible or `--speed` times the captured pace:
+#   python replay.py --capture ~/.stock/records/2025-01-23-091401.ndjson.gz --speed 60
+#   python replay.py --size 1000 --ticks 500 --errors qq=0.3 --malformed sina=0.1
+
+TICK_GAP = 0.2  # seconds
+
+
+def config(args):
+    if args.capture:
+        header, requests = recorder.load(args.capture)
+        cfg = dict(header["config"])
+        times = sorted({round(r["ts"], 1) for r in requests})
+    else:
+        indices, codes = watchlist(args.size, args.seed)
+        cfg = {"indices": indices, "codes": codes, "delay": 6}
+        times = []
+    cfg.setdefault("threshold", {"indices": [2] * len(cfg["indices"]), "up": 7, "down": 5})
+    cfg.setdefault("rest_dates", [])
+    cfg["ticks"] = False  # Tick files are not under test
+    if args.hedge:
+        cfg["hedge"] = args.hedge
+    return cfg, times
+
+
+# Captured request times grouped into ticks, chunks and hedged requests of
+# a tick start together
+def ticks(times, gap=TICK_GAP):
+    result = []
+    for ts in times:
+        if not result or ts - result[-1] >= gap:
+            result.append(ts)
+    return result
+
+
+def replay(args):
+    cfg, times = config(args)
+    with open(stock_runner.configFile, "w", encoding="utf-8") as f:
+        json.dump(cfg, f)
+
+    incidents = []
+    alerts = [0]
+
+    def toast(txts, img=None):
+        if img is None:  # No value in a quote, see checkNotify
+            incidents.append(txts)
+        else:
+            alerts[0] += len(txts)
+
+    stock_runner.ONCE_MODE = False  # Our own arguments are not the runner's
+    stock_runner.log = lambda msg: None
+    stock_runner.toast = toast
+    stub = StubServer(
+        args.capture, faults(args.delay), faults(args.errors), faults(args.malformed), args.seed
+    ).start()
+    stub.route(Servers)
+    try:
+        stock_runner.readConfig()
+        sessions.install(cfg.get("pool_size", sessions.POOL_SIZE))
+        stock_runner.buildGroups()
+        stock_runner.Quotes = stock_runner.openQuotes()
+        stock_runner.Publisher = pubsub.Publisher(stock_runner.pubSockFile, stock_runner.pubAddrFile)
+        stock_runner.JsonData = {"notified": stock_runner.Notified}
+        stock_runner.LastDate = stock_runner.datetime.now().date()
+        stock_runner.Snapshot = snapshot.Writer(io.StringIO())
+
+        clock = ticks(times)
+        count = args.ticks or len(clock) or 200
+        samples = []
+        picked = {}
+        failed = 0
+        failovers = 0
+        last = None  # (server, ok) of the previous tick
+        started = time.perf_counter()
+        for i in range(count):
+            if clock:
+                stub.clock = clock[i % len(clock)]
+                if args.speed and i:
+                    gap = clock[i % len(clock)] - clock[(i - 1) % len(clock)]
+                    time.sleep(max(gap, 0) / args.speed)
+
+            start = time.perf_counter()
+            prices = stock_runner.retrieveStockData()
+            if prices.error is None:
+                stock_runner.fillNames(prices)
+            stock_runner.publishTick(prices, True)
+            samples.append(time.perf_counter() - start)
+
+            name = stock_runner.Server["name"]
+            ok = prices.error is None
+            picked[name] = picked.get(name, 0) + 1
+            failed += not ok
+            if ok and last and not last[1] and last[0] != name:
+                failovers += 1  # Recovered on another provider
+            last = (name, ok)
+        elapsed = time.perf_counter() - started
+    finally:
+        stub.close()
+        if stock_runner.Publisher:
+            stock_runner.Publisher.close()
+        if stock_runner.Quotes:
+            stock_runner.Quotes.close()
+        sessions.closeAll()
+
+    requests = {}
+    for (name, labels), value in metrics.Counters.items():
+        if name == "stock_requests_total":
+            labels = dict(labels)
+            requests.setdefault(labels["provider"], {})[labels["outcome"]] = value
+    return {
+        "ticks": count,
+        "seconds": round(elapsed, 3),
+        "ticks_per_s": round(count / elapsed, 1),
+        "tick_median_ms": round(statistics.median(samples) * 1000, 2),
+        "tick_max_ms": round(max(samples) * 1000, 2),
+        "failed_ticks": failed,
+        "failovers": failovers,
+        "picked": picked,
+        "requests": requests,
+        "stub": stub.counts,
+        "alerts": alerts[0],
+        "none_values": len(incidents),
+        "none_samples": incidents[:5],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay provider responses through the runner")
+    arguments(parser)
+    parser.add_argument("--size", type=int, default=100, help="Synthetic watchlist size without a capture")
+    parser.add_argument("--ticks", type=int, help="Ticks to run, the whole capture by default")
+    parser.add_argument("--speed", type=float, default=0, help="Times the captured pace, 0 for no waits")
+    parser.add_argument("--hedge", type=int)
+    parser.add_argument("--out", help="Write the JSON report to this file")
+    args = parser.parse_args()
+
+    report = {
+        "version": version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": round(time.time()),
+        "capture": args.capture,
+        **replay(args),
+    }
+    shutil.rmtree(HOME, ignore_errors=True)
+    text = json.dumps(report, ensure_ascii=False, indent=1)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+import argparse
+import bisect
+import random
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlparse
+
+from fixtures import response
+
+import recorder  # noqa: E402
+from servers import Servers  # noqa: E402
+
+# Local stand-in for every provider of servers.py. route() points their
+# url_formatter here, a request for provider symbols is answered with the
+# captured response of those symbols current at `clock`, or a synthetic one
+# from fixtures.py. Faults are injected per provider:
+#   delay      seconds added before answering
+#   errors     share of requests answered with HTTP 500
+#   malformed  share of bodies cut short and garbled
+
+
+class StubServer:
+    def __init__(self, capture=None, delay=None, errors=None, malformed=None, seed=0, port=0):
+        self.delay = delay or {}
+        self.errors = errors or {}
+        self.malformed = malformed or {}
+        self.random = random.Random(seed)
+        self.clock = None  # Capture time served, None for the latest
+        self.counts = {}  # provider: {"requests", "captured", "synthetic", "errors", "malformed"}
+        self.lock = threading.Lock()
+        self.servers = {s["name"]: s for s in Servers}
+        self.urls = {}
+
+        self.captured = {}  # (provider, codes): ([ts], [request])
+        if capture:
+            _, requests = recorder.load(capture)
+            for item in sorted(requests, key=lambda r: r["ts"]):
+                times, items = self.captured.setdefault((item["provider"], item["codes"]), ([], []))
+                times.append(item["ts"])
+                items.append(item)
+
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, as the providers
+            disable_nagle_algorithm = True  # Headers and body leave at once
+
+            def do_GET(self):
+                stub.answer(self)
+
+            def log_message(self, *args):
+                pass
+
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="stub", daemon=True).start()
+        return self
+
+    def close(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.restore()
+
+    # Points the providers of `servers` to this server
+    def route(self, servers):
+        for server in servers:
+            name = server["name"]
+            self.urls.setdefault(name, server["url_formatter"])
+            server["url_formatter"] = lambda codes, name=name: f"{self.url}/{name}?codes={quote(codes)}"
+
+    def restore(self):
+        for server in Servers:
+            if server["name"] in self.urls:
+                server["url_formatter"] = self.urls[server["name"]]
+
+    def _count(self, name, what):
+        with self.lock:
+            counts = self.counts.setdefault(
+                name, {"requests": 0, "captured": 0, "synthetic": 0, "errors": 0, "malformed": 0}
+            )
+            counts[what] += 1
+            return counts["requests"]
+
+    def _captured(self, name, codes):
+        found = self.captured.get((name, codes))
+        if not found:
+            return None
+        times, items = found
+        if self.clock is None:
+            return items[-1]
+        i = bisect.bisect_right(times, self.clock)
+        return items[max(i - 1, 0)]
+
+    def answer(self, handler):
+        url = urlparse(handler.path)
+        name = url.path.strip("/")
+        codes = parse_qs(url.query).get("codes", [""])[0]
+        if name not in self.servers:
+            handler.send_error(404)
+            return
+        seq = self._count(name, "requests")
+
+        if self.delay.get(name):
+            time.sleep(self.delay[name])
+        with self.lock:
+            error = self.random.random() < self.errors.get(name, 0)
+            malformed = self.random.random() < self.malformed.get(name, 0)
+        if error:
+            self._count(name, "errors")
+            self._send(handler, 500, b"", "utf-8")
+            return
+
+        item = self._captured(name, codes)
+        if item is not None:
+            self._count(name, "captured")
+            if "error" in item:  # Failed when captured, the connection drops
+                handler.close_connection = True
+                return
+            status, body, encoding = item["status"], item["body"].encode("latin-1"), item["encoding"]
+        else:
+            self._count(name, "synthetic")
+            rsp = response(self.servers[name], codes.split(","), seq)
+            status, body, encoding = 200, rsp.content, rsp.encoding
+
+        if malformed and body:
+            self._count(name, "malformed")
+            body = body[: self.random.randrange(len(body))] + b"\x00\xff"
+        self._send(handler, status, body, encoding)
+
+    def _send(self, handler, status, body, encoding):
+        handler.send_response(status)
+        handler.send_header("Content-Type", f"text/plain; charset={encoding or 'utf-8'}")
+        handler.send_header("Content-Length", str(len(body)))
+        handler.end_headers()
+        handler.wfile.write(body)
+
+
+# provider=value pairs of a command line option
+def faults(pairs):
+    result = {}
+    for pair in pairs or []:
+        name, value = pair.split("=")
+        result[name] = float(value)
+    return result
+
+
+def arguments(parser):
+    parser.add_argument("--capture", help="A capture of the runner (\"record\": true)")
+    parser.add_argument("--delay", nargs="+", metavar="PROVIDER=SECONDS")
+    parser.add_argument("--errors", nargs="+", metavar="PROVIDER=SHARE")
+    parser.add_argument("--malformed", nargs="+", metavar="PROVIDER=SHARE")
+    parser.add_argument("--seed", type=int, default=0)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve captured or synthetic provider responses")
+    parser.add_argument("--port", type=int, default=8765)
+    arguments(parser)
+    args = parser.parse_args()
+
+    stub = StubServer(
+        args.capture, faults(args.delay), faults(args.errors), faults(args.malformed), args.seed, args.port
+    )
+    print(f"Serving {', '.join(stub.servers)} at {stub.url}/<provider>?codes=<symbols>", file=sys.stderr)
+    try:
+        stub.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,73 @@
+import math
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Rolling figures over the whole watchlist, updated once per tick:
+#   change<N>  value now minus the value N minutes ago
+#   high/low   extremes of the session so far
+# Samples are kept in a ring of rows, one column per symbol, at most one per
+# `step` seconds however many groups tick and however fast cadence makes them.
+# Each window keeps a cursor at the newest sample old enough for it, cursors
+# only move forward, so a tick costs a few vector operations whatever the
+# history.
+
+WINDOWS = (1, 5, 15)  # minutes
+
+
+def _list(values):
+    return [None if math.isnan(v) else v for v in values.round(2).tolist()]
+
+
+class Rolling:
+    def __init__(self, keys, step, windows=WINDOWS):
+        self.keys = list(keys)
+        self.windows = windows
+        count = len(keys)
+        self.step = max(step, 1)
+        self.capacity = int(max(windows) * 60 // self.step) + 2  # Samples are at least `step` apart
+        self.values = numpy.full((self.capacity, count), numpy.nan)
+        self.ts = numpy.zeros(self.capacity)
+        self.samples = 0
+        self.cursors = {w: 0 for w in windows}
+        self.high = numpy.full(count, numpy.nan)
+        self.low = numpy.full(count, numpy.nan)
+
+    # Keeps the history of symbols still in `keys`, new ones start empty
+    def remap(self, keys):
+        positions = {k: i for i, k in enumerate(self.keys)}
+        columns = [positions.get(k, -1) for k in keys]
+        kept = numpy.array([c >= 0 for c in columns], bool)
+        picked = numpy.array([max(c, 0) for c in columns], int)
+        self.values = numpy.where(kept, self.values[:, picked], numpy.nan)
+        self.high = numpy.where(kept, self.high[picked], numpy.nan)
+        self.low = numpy.where(kept, self.low[picked], numpy.nan)
+        self.keys = list(keys)
+
+    # `table` is the quotes.QuoteTable of the keys
+    def update(self, table, ts):
+        current = table.array()
+        if not self.samples or ts - self.ts[(self.samples - 1) % self.capacity] >= self.step:
+            row = self.samples % self.capacity
+            self.values[row] = current
+            self.ts[row] = ts
+            self.samples += 1
+        oldest = max(self.samples - self.capacity, 0)
+
+        numpy.fmax(self.high, current, out=self.high)
+        numpy.fmin(self.low, current, out=self.low)
+        result = {"high": _list(self.high), "low": _list(self.low)}
+
+        for window in self.windows:
+            target = ts - window * 60
+            cursor = max(self.cursors[window], oldest)
+            while cursor + 1 < self.samples and self.ts[(cursor + 1) % self.capacity] <= target:
+                cursor += 1
+            self.cursors[window] = cursor
+            if self.ts[cursor % self.capacity] <= target:
+                result[f"change{window}"] = _list(current - self.values[cursor % self.capacity])
+            else:  # Not that much history yet
+                result[f"change{window}"] = [None] * len(self.keys)
+        return result
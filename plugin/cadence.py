@@ -0,0 +1,106 @@
+import threading
+import time
+
+import quotes
+
+# Adaptive polling intervals and per-provider request budgets. Config:
+#   "cadence": {"min": 2, "max": 24, "near": 0.5, "move": 0.3, "quiet": 0.05}
+#   "budgets": {"qq": {"rate": 2, "burst": 10}, ...}
+# An interval halves when a quote moved `move` points in a tick or is within
+# `near` points of its alert threshold, grows by a quarter when nothing moved
+# more than `quiet`, and drifts back to the group's delay otherwise. Each
+# request to a provider takes a token of its bucket, so a shorter interval
+# never exceeds `rate` requests per second on average.
+
+NEAR = 0.5  # percent points to a threshold
+MOVE = 0.3  # percent points in a tick
+QUIET = 0.05
+BUDGET = {"rate": 2, "burst": 10}
+
+_lock = threading.Lock()
+Buckets = {}
+
+
+class Bucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.ts = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.ts) * self.rate)
+        self.ts = now
+
+    # Seconds until `count` tokens are there, 0 if they are
+    def wait(self, count):
+        self._refill()
+        count = min(count, self.burst)  # A large fetch drains a full bucket
+        return max(count - self.tokens, 0) / self.rate
+
+    def take(self, count):
+        self._refill()
+        self.tokens -= count  # May go negative, the debt is paid by waiting
+
+
+def setup(budgets):
+    with _lock:
+        Buckets.clear()
+        for name, budget in budgets.items():
+            Buckets[name] = Bucket(budget.get("rate", BUDGET["rate"]), budget.get("burst", BUDGET["burst"]))
+
+
+def _bucket(name):
+    bucket = Buckets.get(name)
+    if bucket is None:
+        bucket = Buckets[name] = Bucket(BUDGET["rate"], BUDGET["burst"])
+    return bucket
+
+
+# Servers able to send their `counts[name]` requests now, else the seconds
+# to wait
+def ready(servers, counts):
+    with _lock:
+        waits = [(_bucket(s["name"]).wait(counts[s["name"]]), s) for s in servers]
+    now = [s for (w, s) in waits if w == 0]
+    if now:
+        return now, 0
+    return [], min(w for (w, _) in waits)
+
+
+def take(name, count):
+    with _lock:
+        _bucket(name).take(count)
+
+
+class Controller:
+    def __init__(self, delay, config):
+        self.delay = delay
+        self.interval = delay
+        self.min = config.get("min", max(delay / 3, 1))
+        self.max = config.get("max", delay * 4)
+        self.near = config.get("near", NEAR)
+        self.move = config.get("move", MOVE)
+        self.quiet = config.get("quiet", QUIET)
+        self.last = None
+
+    # Next interval after a tick of `values`, `headroom` is the least distance
+    # of any of them to its threshold
+    # `table` is the quotes.QuoteTable of a tick
+    def update(self, table, headroom):
+        moved = 0
+        last = self.last
+        if last is not None and len(last) == len(table):
+            for old, new, was, state in zip(last.numbers, table.numbers, last.status, table.status):
+                if was <= quotes.INT and state <= quotes.INT:
+                    moved = max(moved, abs(new - old))
+        self.last = table.copy()
+
+        if moved >= self.move or headroom <= self.near:
+            self.interval = max(self.min, self.interval / 2)
+        elif moved <= self.quiet:
+            self.interval = min(self.max, self.interval * 1.25)
+        else:
+            self.interval += (self.delay - self.interval) / 2
+        return self.interval
@@ -0,0 +1,144 @@
+import bisect
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Counters and latency histograms of the runner stages, exported in the
+# Prometheus text format to a file, and to http://127.0.0.1:<port>/metrics
+# when "metrics_port" is configured. Series are keyed by name and labels:
+#   inc("stock_requests_total", provider="qq", outcome="ok")
+#   observe("stock_fetch_seconds", 0.12, provider="qq")
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+WRITE_INTERVAL = 15  # seconds
+
+Counters = {}
+Histograms = {}  # key: [counts per bucket and +Inf, sum, count]
+Started = time.time()
+_lock = threading.Lock()
+_written_ts = 0
+_server = None
+
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+
+def inc(name, value=1, **labels):
+    key = _key(name, labels)
+    with _lock:
+        Counters[key] = Counters.get(key, 0) + value
+
+
+def observe(name, seconds, **labels):
+    key = _key(name, labels)
+    with _lock:
+        hist = Histograms.get(key)
+        if hist is None:
+            hist = Histograms[key] = [[0] * (len(BUCKETS) + 1), 0.0, 0]
+        hist[0][bisect.bisect_left(BUCKETS, seconds)] += 1
+        hist[1] += seconds
+        hist[2] += 1
+
+
+def _labels(labels, **extra):
+    pairs = list(labels) + list(extra.items())
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{v}"' for (k, v) in pairs) + "}"
+
+
+# `gauges` are extra name: value series read at render time
+def render(gauges=None):
+    lines = []
+    with _lock:
+        counters = sorted(Counters.items())
+        histograms = sorted((k, [list(h[0]), h[1], h[2]]) for (k, h) in Histograms.items())
+    typed = set()
+    for (name, labels), value in counters:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} counter")
+        lines.append(f"{name}{_labels(labels)} {value}")
+    for (name, labels), (counts, total, count) in histograms:
+        if name not in typed:
+            typed.add(name)
+            lines.append(f"# TYPE {name} histogram")
+        cumulative = 0
+        for bound, n in zip(BUCKETS + ("+Inf",), counts):
+            cumulative += n
+            lines.append(f"{name}_bucket{_labels(labels, le=bound)} {cumulative}")
+        lines.append(f"{name}_sum{_labels(labels)} {total:.6f}")
+        lines.append(f"{name}_count{_labels(labels)} {count}")
+    for name, value in (gauges or {}).items():
+        lines.append(f"# TYPE {name} gauge")
+        lines.append(f"{name} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def write(path, gauges=None, force=False):
+    global _written_ts
+    now = time.time()
+    if not force and now - _written_ts < WRITE_INTERVAL:
+        return
+    _written_ts = now
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        f.write(render(gauges() if gauges else None))
+    os.replace(tmp, path)
+
+
+# Upper bound of the bucket holding the `q` quantile
+def quantile(hist, q):
+    counts, _, count = hist
+    if not count:
+        return None
+    cumulative = 0
+    for bound, n in zip(BUCKETS + (float("inf"),), counts):
+        cumulative += n
+        if cumulative >= q * count:
+            return bound
+
+
+# One line for the log, fetch latency quantiles are bucket bounds in ms
+def summary():
+    parts = [f"uptime {round(time.time() - Started)}s"]
+    with _lock:
+        for (name, labels), value in sorted(Counters.items()):
+            parts.append(f"{name[6:]}{_labels(labels)}={value}")
+        for (name, labels), hist in sorted(Histograms.items()):
+            p50, p95 = quantile(hist, 0.5), quantile(hist, 0.95)
+            parts.append(
+                f"{name[6:]}{_labels(labels)} n={hist[2]} avg={hist[1] / hist[2] * 1000:.1f}ms"
+                f" p50<={p50 * 1000:g}ms p95<={p95 * 1000:g}ms"
+            )
+    return "; ".join(parts)
+
+
+def serve(port, gauges=None):
+    global _server
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path != "/metrics":
+                self.send_error(404)
+                return
+            body = render(gauges() if gauges else None).encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass  # Scrapes stay out of stock.log
+
+    _server = ThreadingHTTPServer(("127.0.0.1", port), Handler)
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+
+
+def close():
+    if _server:
+        _server.shutdown()
+        _server.server_close()
@@ -0,0 +1,206 @@
+import json
+import os
+import queue
+import shutil
+import socket
+import subprocess
+import sys
+import threading
+import time
+from datetime import datetime
+
+# Notifications leave the polling loop through a bounded queue, a worker
+# thread coalesces what arrives within `window` seconds into one batch and
+# hands it to every sink. Config:
+#   "notify": {"sinks": ["toast", {"type": "file", "path": "~/alerts.log"}],
+#              "window": 1, "queue": 100}
+# Sinks: toast (Windows), desktop (notify-send), file, socket ("address" of
+# "<path>" or "<host>:<port>", a JSON line per batch) and null.
+
+WINDOW = 1  # seconds
+QUEUE_SIZE = 100
+
+_queue = None
+_worker = None
+_sinks = []
+_window = WINDOW
+_lock = threading.Lock()
+Dropped = 0
+
+
+class ToastSink:
+    def __init__(self, _):
+        from windows_toasts import Toast, WindowsToaster, ToastDisplayImage
+
+        self.Toast = Toast
+        self.ToastDisplayImage = ToastDisplayImage
+        self.toaster = WindowsToaster("Stock Runner")  # Kept, not one per toast
+
+    def send(self, txts, img):
+        toast = self.Toast()
+        toast.text_fields = txts
+        if img:
+            toast.AddImage(self.ToastDisplayImage.fromPath(img))
+        self.toaster.show_toast(toast)
+
+
+class DesktopSink:
+    def __init__(self, _):
+        self.command = shutil.which("notify-send")
+        if self.command is None:
+            raise RuntimeError("notify-send not found")
+
+    def send(self, txts, img):
+        args = [self.command, "-a", "Stock Runner"]
+        if img:
+            args += ["-i", img]
+        subprocess.run(args + ["Stock Runner", "\n".join(txts)], timeout=5, check=False)
+
+
+class FileSink:
+    def __init__(self, cfg):
+        self.path = os.path.expanduser(cfg["path"])
+
+    def send(self, txts, img):
+        with open(self.path, "a", encoding="utf-8") as f:
+            stamp = datetime.now().strftime("%m-%d %H:%M:%S")
+            f.writelines(f"{stamp} {txt}\n" for txt in txts)
+
+
+class SocketSink:
+    def __init__(self, cfg):
+        self.address = cfg["address"]
+
+    def send(self, txts, img):
+        if ":" in self.address and hasattr(socket, "AF_INET"):
+            host, port = self.address.rsplit(":", 1)
+            conn = socket.create_connection((host, int(port)), timeout=2)
+        else:
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            conn.settimeout(2)
+            conn.connect(self.address)
+        with conn:
+            line = json.dumps({"ts": time.time(), "txts": txts, "img": img}, ensure_ascii=False)
+            conn.sendall((line + "\n").encode("utf-8"))
+
+
+class NullSink:
+    def __init__(self, _):
+        self.sent = []
+
+    def send(self, txts, img):
+        self.sent.append((txts, img))
+
+
+SINKS = {
+    "toast": ToastSink,
+    "desktop": DesktopSink,
+    "file": FileSink,
+    "socket": SocketSink,
+    "null": NullSink,
+}
+
+
+def _default(folder):
+    if sys.platform == "win32":
+        return ["toast"]
+    if shutil.which("notify-send"):
+        return ["desktop"]
+    return [{"type": "file", "path": os.path.join(folder, "stock.alerts.log")}]
+
+
+# Builds the sinks of `config`, returns errors of those left out
+def setup(config, folder):
+    global _sinks, _window
+    sinks = []
+    errors = []
+    for cfg in config.get("sinks") or _default(folder):
+        cfg = {"type": cfg} if type(cfg) is str else cfg
+        try:
+            sinks.append(SINKS[cfg["type"]](cfg))
+        except Exception as er:
+            errors.append(f"{cfg['type']}: {repr(er)}")
+    with _lock:
+        _sinks = sinks
+        _window = config.get("window", WINDOW)
+    return errors
+
+
+def start(config, folder, log):
+    global _queue, _worker
+    for error in setup(config, folder):
+        log(f"Notification sink skipped, {error}")
+    _queue = queue.Queue(config.get("queue", QUEUE_SIZE))
+    _worker = threading.Thread(target=_run, args=(log,), name="notify", daemon=True)
+    _worker.start()
+
+
+# Never blocks, the oldest waiting notification is dropped when full
+def send(txts, img=None):
+    global Dropped
+    if type(txts) is str:
+        txts = [txts]
+    if _queue is None:
+        return False
+    while True:
+        try:
+            _queue.put_nowait((list(txts), img))
+            return True
+        except queue.Full:
+            try:
+                _queue.get_nowait()
+                Dropped += 1
+            except queue.Empty:
+                pass
+
+
+def _merge(batch):
+    txts = [txt for (t, _) in batch for txt in t]
+    imgs = {img for (_, img) in batch if img}
+    if len(imgs) > 1:  # Ups and downs together
+        return txts, os.path.join(os.path.dirname(imgs.pop()), "updown.png")
+    return txts, imgs.pop() if imgs else None
+
+
+def _run(log):
+    while True:
+        item = _queue.get()
+        if item is None:
+            return
+        batch = [item]
+        deadline = time.monotonic() + _window
+        stop = False
+        while True:
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                break
+            try:
+                item = _queue.get(timeout=wait)
+            except queue.Empty:
+                break
+            if item is None:
+                stop = True
+                break
+            batch.append(item)
+
+        txts, img = _merge(batch)
+        with _lock:
+            sinks = list(_sinks)
+        for sink in sinks:
+            try:
+                sink.send(txts, img)
+            except Exception as er:
+                log(f"Notification via {type(sink).__name__} failed: {repr(er)}")
+        if stop:
+            return
+
+
+# Delivers what is queued, waiting at most `timeout` seconds
+def close(timeout=5):
+    if _worker is None:
+        return
+    try:
+        _queue.put(None, timeout=timeout)
+    except queue.Full:
+        pass
+    _worker.join(timeout)
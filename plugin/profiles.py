@@ -0,0 +1,201 @@
+import json
+import os
+import sys
+from datetime import datetime
+
+import quotebuf
+import quotes
+import rules
+import snapshot
+import symbols
+
+# Daemon mode serves several profiles from one runner. ~/.stock/daemon.json
+#   {"profiles": {"alice": "/home/alice/.stock", "bob": "/home/bob/.stock"}}
+# names folders laid out like ~/.stock. Their watchlists are merged into one
+# deduplicated fetch set, each profile gets its own data file, quote region,
+# pid file and alert state projected from the merged quotes.
+
+Profiles = {}
+
+
+def _unique(items):
+    return list(dict.fromkeys(items))
+
+
+def configFile(folder):
+    return os.path.join(folder, "cfg", "stock.cfg.json")
+
+
+def pidFile(folder):
+    return os.path.join(folder, "stock.runner.pid")
+
+
+# Pid of another runner serving `folder`, None if none is alive. One being
+# started by an editor has written an empty pid file, "" then.
+def runnerOf(folder):
+    try:
+        with open(pidFile(folder), "r", encoding="utf-8") as f:
+            text = f.read().strip()
+    except OSError:
+        return None
+    if not text:
+        return text
+    try:
+        pid = int(text)
+    except ValueError:
+        return None
+    if pid == os.getpid():
+        return None
+    if sys.platform == "win32":  # os.kill would terminate it
+        try:
+            import psutil
+        except ImportError:
+            return pid  # Cannot tell, the profile is left to it
+        return pid if psutil.pid_exists(pid) else None
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return None
+    except PermissionError:
+        pass  # Alive, started by another user
+    return pid
+
+
+# Config of the merged watchlist, None if no profile could be read
+def load(path, log):
+    with open(path, "r", encoding="utf-8") as f:
+        folders = json.load(f)["profiles"]
+
+    configs = {}
+    for name, folder in folders.items():
+        folder = os.path.expanduser(folder)
+        try:
+            with open(configFile(folder), "r", encoding="utf-8") as f:
+                configs[name] = (folder, json.load(f))
+        except Exception as er:
+            log(f"Profile {name} skipped: {repr(er)}")
+
+    for name in list(Profiles):
+        if name not in configs:
+            Profiles.pop(name).close()
+    for name, (folder, config) in list(configs.items()):
+        if name in Profiles and Profiles[name].folder == folder:
+            Profiles[name].configure(config)
+        else:
+            if name in Profiles:
+                Profiles.pop(name).close()
+            pid = runnerOf(folder)
+            if pid is not None:  # A single writer per data file and quote region
+                log(f"Profile {name} skipped: its own runner {pid or '(starting)'} serves it")
+                configs.pop(name)
+                continue
+            Profiles[name] = Profile(name, folder, config)
+    if not Profiles:
+        return None
+
+    merged = dict(next(iter(configs.values()))[1])
+    thresholds = {}
+    for _, config in configs.values():
+        for code, threshold in zip(config["indices"], config["threshold"]["indices"]):
+            thresholds.setdefault(code, threshold)
+    merged["indices"] = _unique(i for (_, c) in configs.values() for i in c["indices"])
+    merged["codes"] = _unique(i for (_, c) in configs.values() for i in c["codes"])
+    merged["threshold"] = dict(merged["threshold"], indices=[thresholds[i] for i in merged["indices"]])
+    merged["delay"] = min(c["delay"] for (_, c) in configs.values())
+    merged["rest_dates"] = _unique(d for (_, c) in configs.values() for d in c["rest_dates"])
+    return merged
+
+
+def mtime():
+    return max((os.path.getmtime(configFile(p.folder)) for p in Profiles.values()), default=0)
+
+
+def publish(prices, keys, market_time, alert):
+    for profile in Profiles.values():
+        profile.publish(prices, keys, market_time, alert)
+
+
+def heartbeat():
+    for profile in Profiles.values():
+        profile.quotes.heartbeat()
+
+
+def closeAll():
+    for profile in Profiles.values():
+        profile.close()
+    Profiles.clear()
+
+
+class Profile:
+    def __init__(self, name, folder, config):
+        self.name = name
+        self.folder = folder
+        self.dataFile = os.path.join(folder, "stock.dat.json")
+        self.pidFile = pidFile(folder)
+
+        notified = []
+        if os.path.exists(self.dataFile):
+            with open(self.dataFile, "r", encoding="utf-8") as f:
+                text = f.read()
+            if text and datetime.fromtimestamp(os.path.getmtime(self.dataFile)).date() == datetime.now().date():
+                notified = snapshot.load(text)[1].get("notified", [])
+        self.notified = notified
+        self.day = datetime.now().date()
+        self.data = {"notified": self.notified}
+        self.f = open(self.dataFile, "w", encoding="utf-8")
+        self.writer = snapshot.Writer(self.f, config.get("compact_every", snapshot.COMPACT_EVERY))
+        self.quotes = None
+        self.configure(config)
+        with open(self.pidFile, "w", encoding="utf-8") as f:
+            f.write(str(os.getpid()))  # Editors of the profile see a runner
+
+    def configure(self, config):
+        self.config = config
+        self.keys = [symbols.key(i, True) for i in config["indices"]] + [symbols.key(c) for c in config["codes"]]
+        self.positions = None  # Into the merged keys, found on the next publish
+        self.table = quotes.QuoteTable(self.keys)  # The merged quotes at positions
+        self.rules = None
+        if self.quotes is None or self.quotes.capacity < len(self.keys):
+            if self.quotes:
+                self.quotes.close()
+            self.quotes = quotebuf.Writer(
+                os.path.join(self.folder, "stock.dat.shm"),
+                max(config.get("shm_slots", quotebuf.CAPACITY), len(self.keys)),
+            )
+
+    def publish(self, prices, keys, market_time, alert):
+        if prices.error is None:
+            if self.positions is None or self.mergedKeys is not keys:
+                index = {k: i for i, k in enumerate(keys)}
+                self.positions = [index[k] for k in self.keys]
+                self.mergedKeys = keys
+            self.table.project(prices, self.positions)
+            prices = self.table
+
+            newDay = self.day != datetime.now().date()
+            if newDay:
+                self.day = datetime.now().date()
+                self.notified.clear()
+                self.rules = None
+            if self.rules is None:
+                self.rules = rules.Engine(self.config, self.keys, self.notified)
+            if market_time and not newDay:
+                alerts = self.rules.evaluate(prices)
+                self.notified[:] = self.rules.notified()
+                if alerts:
+                    alert(prices, alerts, self.name)
+            self.data["hl"] = self.rules.classes(prices)
+
+        self.data["prices"] = prices.published()
+        record = self.writer.record(self.data)
+        if record is None:
+            self.quotes.heartbeat()
+        else:
+            self.quotes.publish(prices, self.data.get("hl"))
+            self.writer.write(record, self.data)
+
+    def close(self):
+        self.f.close()
+        self.quotes.close()
+        if runnerOf(self.folder) is None and os.path.exists(self.pidFile):  # Not taken over since
+            os.remove(self.pidFile)
@@ -0,0 +1,171 @@
+import json
+import os
+import queue
+import socket
+import threading
+
+import quotes
+import snapshot
+
+# Local sockets of the runner. The publisher pushes snapshot records (see
+# snapshot.py) to subscribers, one JSON line each: a base of the current
+# state first, then every record as soon as the runner publishes it. The
+# responder answers one-shot queries, a line in and a JSON line out.
+# Both write their address to a file, "pipe <path>" or "tcp <host>:<port>".
+# Each subscriber is written by a thread of its own from a bounded queue, so a
+# stalled editor never holds up a tick. One falling QUEUE_SIZE records behind,
+# or taking SEND_TIMEOUT to take one, is dropped and subscribes again.
+
+SEND_TIMEOUT = 1  # seconds
+QUEUE_SIZE = 32  # records
+QUERY_TIMEOUT = 2
+
+
+# Listening socket, Unix domain where there is one, localhost TCP otherwise
+def listen(sockFile, addrFile):
+    if hasattr(socket, "AF_UNIX"):
+        if os.path.exists(sockFile):
+            os.remove(sockFile)  # Left by a crashed runner
+        server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        server.bind(sockFile)
+        address = f"pipe {sockFile}"
+    else:
+        server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        server.bind(("127.0.0.1", 0))
+        address = "tcp 127.0.0.1:%d" % server.getsockname()[1]
+    server.listen()
+    with open(addrFile, "w", encoding="utf-8") as f:
+        f.write(address)
+    return server
+
+
+def unlink(sockFile, addrFile):
+    for path in (addrFile, sockFile):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+class Subscriber:
+    def __init__(self, conn, dropped):
+        self.conn = conn
+        self.dropped = dropped  # Called once the connection is done
+        self.queue = queue.Queue(QUEUE_SIZE)
+        self.thread = threading.Thread(target=self._send, name="subscriber", daemon=True)
+        self.thread.start()
+
+    def _send(self):
+        while True:
+            payload = self.queue.get()
+            if payload is None:
+                break
+            try:
+                self.conn.sendall(payload)
+            except OSError:
+                break
+        self.dropped(self)
+        self.conn.close()
+
+    # False when it fell behind
+    def put(self, payload):
+        try:
+            self.queue.put_nowait(payload)
+            return True
+        except queue.Full:
+            return False
+
+    def close(self):
+        try:
+            self.queue.put_nowait(None)
+        except queue.Full:
+            try:
+                self.conn.shutdown(socket.SHUT_RDWR)  # Wakes a blocked send
+            except OSError:
+                pass
+
+
+class Publisher:
+    def __init__(self, sockFile, addrFile):
+        self.sockFile = sockFile
+        self.addrFile = addrFile
+        self.lock = threading.Lock()
+        self.subscribers = []
+        self.seq = 0
+        self.data = None
+
+        self.server = listen(sockFile, addrFile)
+        self.thread = threading.Thread(target=self._accept, name="publisher", daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return  # Closed
+            conn.settimeout(SEND_TIMEOUT)
+            with self.lock:
+                subscriber = Subscriber(conn, self._drop)
+                if self.data is not None:
+                    subscriber.put(snapshot.dump(self.data, self.seq).encode("utf-8"))
+                self.subscribers.append(subscriber)
+
+    def _drop(self, subscriber):
+        with self.lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    # `data` is the state after `line`, for subscribers joining later
+    def publish(self, line, seq, data):
+        payload = line.encode("utf-8")
+        with self.lock:
+            self.seq = seq
+            self.data = data
+            for subscriber in list(self.subscribers):
+                if not subscriber.put(payload):  # Fell behind
+                    self.subscribers.remove(subscriber)
+                    subscriber.close()
+
+    def close(self):
+        with self.lock:
+            for subscriber in self.subscribers:
+                subscriber.close()
+            self.subscribers.clear()
+        self.server.close()
+        unlink(self.sockFile, self.addrFile)
+
+
+class Responder:
+    # `handler(query)` returns what to answer, serialized as JSON
+    def __init__(self, sockFile, addrFile, handler):
+        self.sockFile = sockFile
+        self.addrFile = addrFile
+        self.handler = handler
+        self.server = listen(sockFile, addrFile)
+        self.thread = threading.Thread(target=self._accept, name="responder", daemon=True)
+        self.thread.start()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self.server.accept()
+            except OSError:
+                return  # Closed
+            threading.Thread(target=self._answer, args=(conn,), daemon=True).start()
+
+    def _answer(self, conn):
+        with conn:
+            conn.settimeout(QUERY_TIMEOUT)
+            try:
+                query = conn.makefile("r", encoding="utf-8").readline().strip()
+                try:
+                    reply = {"data": self.handler(query)}
+                except Exception as er:
+                    reply = {"error": repr(er)}
+                line = json.dumps(reply, ensure_ascii=False, default=quotes.jsonable)
+                conn.sendall((line + "\n").encode("utf-8"))
+            except OSError:
+                pass  # Gone before the answer
+
+    def close(self):
+        self.server.close()
+        unlink(self.sockFile, self.addrFile)
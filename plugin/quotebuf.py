@@ -0,0 +1,171 @@
+import mmap
+import os
+import struct
+import time
+
+from quotes import INT, MISSING, PLACEHOLDER, VALUE  # noqa: F401, slot states
+from servers import VAL_PLACEHOLDER
+
+# Fixed layout region shared by the runner and editors, guarded by a seqlock:
+# the writer makes `seq` odd, writes, then makes it even again; readers copy
+# while `seq` is even and unchanged across the copy.
+#
+#   header  magic, version, seq, heartbeat, publish ts, count, capacity, error length
+#   error   ERROR_SIZE bytes of utf-8
+#   slots   value f64, state u8, highlight class u8, name length u8, name utf-8
+
+MAGIC = b"STKQ"
+VERSION = 2  # Slots carry the highlight class
+HEADER = struct.Struct("<4sHxxQddIII4x")
+ERROR_SIZE = 256
+NAME_SIZE = 21
+SLOT = struct.Struct(f"<dBBB{NAME_SIZE}s")
+SLOTS_OFFSET = HEADER.size + ERROR_SIZE
+SEQ_OFFSET = 8
+HEARTBEAT_OFFSET = 16
+CAPACITY = 4096
+
+_seq = struct.Struct("<Q")
+_ts = struct.Struct("<d")
+
+
+def _size(capacity):
+    return SLOTS_OFFSET + SLOT.size * capacity
+
+
+_encoded = {}
+
+
+def _name(name):
+    raw = _encoded.get(name)
+    if raw is None:
+        raw = name.encode("utf-8")[:NAME_SIZE]
+        raw = _encoded[name] = raw.decode("utf-8", "ignore").encode("utf-8")  # Whole chars only
+    return raw
+
+
+class Writer:
+    def __init__(self, path, capacity=CAPACITY):
+        self.path = path
+        size = _size(capacity)
+        mode = "r+b" if os.path.exists(path) else "w+b"
+        self.f = open(path, mode)
+        current = os.fstat(self.f.fileno()).st_size
+        if current < size:
+            try:
+                self.f.truncate(size)
+            except OSError:  # Mapped by readers on Windows, keep what there is
+                size = current
+        self.capacity = (max(size, SLOTS_OFFSET) - SLOTS_OFFSET) // SLOT.size
+        self.mm = mmap.mmap(self.f.fileno(), _size(self.capacity))
+        magic, version, self.seq, _, ts, count, _, errlen = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION or self.seq % 2:
+            self.seq, ts, count, errlen = 0, 0, 0, 0
+        # The last publish stays readable until the first one of this runner
+        HEADER.pack_into(
+            self.mm, 0, MAGIC, VERSION, self.seq, time.time(), ts,
+            min(count, self.capacity), self.capacity, errlen,
+        )
+
+    def heartbeat(self):
+        _ts.pack_into(self.mm, HEARTBEAT_OFFSET, time.time())
+
+    # `classes` are the rules.CLASSES indices of the quotes.QuoteTable
+    def publish(self, table, classes=None):
+        mm = self.mm
+        self.seq += 1  # Odd, readers back off
+        _seq.pack_into(mm, SEQ_OFFSET, self.seq)
+
+        now = time.time()
+        if table.error is not None:
+            error = table.error.encode("utf-8")[:ERROR_SIZE]
+            mm[HEADER.size:HEADER.size + len(error)] = error
+            count = 0
+        else:
+            error = b""
+            count = min(len(table), self.capacity)
+            offset = SLOTS_OFFSET
+            numbers, status, names = table.numbers, table.status, table.names
+            for i in range(count):
+                raw = _name(names[i])
+                SLOT.pack_into(mm, offset, numbers[i], status[i], classes[i] if classes else 0, len(raw), raw)
+                offset += SLOT.size
+
+        self.seq += 1
+        HEADER.pack_into(mm, 0, MAGIC, VERSION, self.seq, now, now, count, self.capacity, len(error))
+
+    def close(self):
+        self.mm.close()
+        self.f.close()
+
+
+class Reader:
+    def __init__(self, path):
+        self.path = path
+        self.mm = None
+        self.size = 0
+
+    def _open(self):
+        if self.mm is not None:
+            capacity = struct.unpack_from("<I", self.mm, 36)[0]
+            if _size(capacity) <= self.size:
+                return True
+            self.close()  # Grown by a new runner
+        if not os.path.exists(self.path):
+            return False
+        with open(self.path, "rb") as f:
+            self.size = os.fstat(f.fileno()).st_size
+            if self.size < SLOTS_OFFSET:
+                return False
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return True
+
+    def header(self):
+        if not self._open():
+            return None
+        magic, version, seq, heartbeat, ts, count, capacity, errlen = HEADER.unpack_from(self.mm, 0)
+        if magic != MAGIC or version != VERSION:
+            return None
+        return {"seq": seq, "heartbeat": heartbeat, "ts": ts, "count": count, "capacity": capacity}
+
+    # Consistent copy of the latest publish, None if there is none
+    def snapshot(self, retries=100):
+        if not self._open():
+            return None
+        mm = self.mm
+        for _ in range(retries):
+            seq = _seq.unpack_from(mm, SEQ_OFFSET)[0]
+            if seq % 2:
+                time.sleep(0)
+                continue
+            _, version, _, heartbeat, ts, count, capacity, errlen = HEADER.unpack_from(mm, 0)
+            if version != VERSION:
+                return None  # Another layout, readers fall back to the data file
+            if errlen:
+                prices = mm[HEADER.size:HEADER.size + errlen]
+            else:
+                region = mm[SLOTS_OFFSET:SLOTS_OFFSET + SLOT.size * min(count, capacity)]
+            if _seq.unpack_from(mm, SEQ_OFFSET)[0] != seq:
+                continue
+            if errlen:
+                prices = prices.decode("utf-8", "replace")
+            else:
+                prices = []
+                classes = []
+                for value, state, hl, length, raw in SLOT.iter_unpack(region):
+                    if state == PLACEHOLDER:
+                        value = VAL_PLACEHOLDER
+                    elif state == MISSING:
+                        value = None
+                    elif state == INT:
+                        value = int(value)
+                    prices.append([raw[:length].decode("utf-8"), value])
+                    classes.append(hl)
+                return {"seq": seq, "heartbeat": heartbeat, "ts": ts, "prices": prices, "hl": classes}
+            return {"seq": seq, "heartbeat": heartbeat, "ts": ts, "prices": prices}
+        return None
+
+    def close(self):
+        if self.mm is not None:
+            self.mm.close()
+            self.mm = None
@@ -0,0 +1,189 @@
+import sys
+from array import array
+
+from servers import NAME_PLACEHOLDER, VAL_PLACEHOLDER
+
+# Quotes of a fixed list of symbols, kept column by column and filled in place
+# by the parsers, so a tick allocates no object per symbol. Names are interned
+# and kept once, values live in a float array, and each slot has a status for
+# what a float cannot say. A failed fetch sets `error` instead of turning the
+# quotes into a string, the string only appears on the wire, see published().
+# Rows ([name, value]) are built only for JSON and the rare reader wanting them.
+
+# Slot states, also the slot states of quotebuf.py
+VALUE = 0
+INT = 1
+PLACEHOLDER = 2  # VAL_PLACEHOLDER
+MISSING = 3  # None
+
+_interned = {}  # Parsed name: interned name
+_shortened = {}  # Parsed name: first two characters, as price providers show
+_numpy = False  # Looked up on first use, stock_query.py fetches without numpy
+
+
+def _np():
+    global _numpy
+    if _numpy is False:
+        try:
+            import numpy as module
+        except ImportError:
+            module = None
+        _numpy = module
+    return _numpy
+
+
+def _intern(name):
+    interned = _interned.get(name)
+    if interned is None:
+        interned = _interned[name] = sys.intern(name)
+    return interned
+
+
+def _short(name):
+    short = _shortened.get(name)
+    if short is None:
+        short = _shortened[name] = sys.intern(name[0:2].replace(" ", ""))
+    return short
+
+
+class QuoteTable:
+    __slots__ = ("keys", "names", "numbers", "status", "error", "short")
+
+    # `short` names keep their first two characters, see servers "has_price"
+    def __init__(self, keys, names=None, short=False):
+        count = len(keys)
+        self.keys = keys
+        self.names = list(names) if names is not None else [NAME_PLACEHOLDER] * count
+        self.numbers = array("d", bytes(8 * count))
+        self.status = bytearray([PLACEHOLDER]) * count
+        self.error = None
+        self.short = short
+
+    def __len__(self):
+        return len(self.keys)
+
+    # [name, value] of a slot, for the few readers of single quotes
+    def __getitem__(self, i):
+        if not -len(self.keys) <= i < len(self.keys):
+            raise IndexError(i)
+        return [self.names[i], self.value(i)]
+
+    def __repr__(self):
+        return self.error if self.error is not None else repr(self.rows())
+
+    def set(self, i, name, value):
+        self.names[i] = _short(name) if self.short else _intern(name)
+        self.setValue(i, value)
+
+    def setValue(self, i, value):
+        if type(value) is float:
+            self.numbers[i] = value
+            self.status[i] = VALUE
+        elif type(value) is int:
+            self.numbers[i] = value
+            self.status[i] = INT
+        elif value is None:
+            self.numbers[i] = 0.0
+            self.status[i] = MISSING
+        elif value == VAL_PLACEHOLDER:
+            self.numbers[i] = 0.0
+            self.status[i] = PLACEHOLDER
+        else:  # A number in a string, as some providers send
+            try:
+                self.numbers[i] = float(value)
+                self.status[i] = VALUE
+            except ValueError:
+                self.numbers[i] = 0.0
+                self.status[i] = PLACEHOLDER
+
+    def value(self, i):
+        state = self.status[i]
+        if state == VALUE:
+            return self.numbers[i]
+        if state == INT:
+            return int(self.numbers[i])
+        return VAL_PLACEHOLDER if state == PLACEHOLDER else None
+
+    def values(self):
+        return [self.value(i) for i in range(len(self.keys))]
+
+    def rows(self):
+        return [[name, self.value(i)] for i, name in enumerate(self.names)]
+
+    # What the data file and readers get, the rows or the error message
+    def published(self):
+        return self if self.error is None else self.error
+
+    # Values as a float array, NaN without one, a single vector operation
+    def array(self):
+        np = _np()
+        numbers = np.frombuffer(self.numbers, float)
+        status = np.frombuffer(self.status, np.uint8)
+        return np.where(status <= INT, numbers, np.nan)
+
+    # Slots whose provider returned no value at all
+    def missing(self):
+        if MISSING not in self.status:
+            return []
+        return [i for i, state in enumerate(self.status) if state == MISSING]
+
+    def rename(self, names):
+        if self.names != names:
+            self.names[:] = names
+
+    # Takes the values of `table` at `positions` of this one, in order
+    def merge(self, table, positions):
+        numbers, status = self.numbers, self.status
+        for j, pos in enumerate(positions):
+            numbers[pos] = table.numbers[j]
+            status[pos] = table.status[j]
+
+    # Takes the slots of `table` at its `positions`, names included
+    def project(self, table, positions):
+        for i, pos in enumerate(positions):
+            self.names[i] = table.names[pos]
+            self.numbers[i] = table.numbers[pos]
+            self.status[i] = table.status[pos]
+        self.error = table.error
+
+    # Keeps the quotes of keys also in `table`, the others stay placeholders
+    def carry(self, table):
+        index = {k: j for j, k in enumerate(table.keys)}
+        for i, key in enumerate(self.keys):
+            j = index.get(key)
+            if j is not None:
+                self.numbers[i] = table.numbers[j]
+                self.status[i] = table.status[j]
+
+    def copy(self):
+        table = QuoteTable.__new__(QuoteTable)
+        table.keys = self.keys
+        table.names = list(self.names)
+        table.numbers = array("d", self.numbers)
+        table.status = bytearray(self.status)
+        table.error = self.error
+        table.short = self.short
+        return table
+
+    # Slots differing from `other`, a table of the same keys
+    def changed(self, other):
+        np = _np()
+        if np:
+            moved = np.frombuffer(self.numbers, float) != np.frombuffer(other.numbers, float)
+            moved |= np.frombuffer(self.status, np.uint8) != np.frombuffer(other.status, np.uint8)
+            result = set(np.flatnonzero(moved).tolist())
+        else:
+            result = {
+                i for i in range(len(self.keys))
+                if self.numbers[i] != other.numbers[i] or self.status[i] != other.status[i]
+            }
+        if self.names != other.names:
+            result.update(i for i, (a, b) in enumerate(zip(self.names, other.names)) if a != b)
+        return sorted(result)
+
+
+# `default` of json.dumps, tables are written as rows
+def jsonable(o):
+    if type(o) is QuoteTable:
+        return o.rows()
+    raise TypeError(f"{type(o).__name__} is not JSON serializable")
@@ -0,0 +1,80 @@
+import gzip
+import json
+import os
+import threading
+import time
+from datetime import datetime
+
+# Capture of raw provider responses for offline replay, see bench/replay.py.
+# With "record": true the runner appends to ~/.stock/records/<start>.ndjson.gz
+# a header line, then one line per request:
+#   {"config": {...}, "keys": [...], "ts": ...}
+#   {"ts": 1737615603.1, "provider": "qq", "codes": "sh000001,...", "ms": 42,
+#    "status": 200, "encoding": "GBK", "body": "..."}   or "error": "..."
+# Bodies are kept byte for byte, decoded as latin-1.
+
+FLUSH_INTERVAL = 10  # seconds
+
+Active = False
+_file = None
+_lock = threading.Lock()
+_flushed_ts = 0
+
+
+def start(folder, config, keys):
+    global Active, _file
+    os.makedirs(folder, exist_ok=True)
+    path = os.path.join(folder, datetime.now().strftime("%Y-%m-%d-%H%M%S") + ".ndjson.gz")
+    _file = gzip.open(path, "at", encoding="utf-8")
+    watched = {k: config[k] for k in ("indices", "codes", "delay", "hedge") if k in config}
+    _write({"config": watched, "keys": keys, "ts": time.time()})
+    Active = True
+    return path
+
+
+def _write(item):
+    global _flushed_ts
+    line = json.dumps(item, ensure_ascii=False) + "\n"
+    with _lock:
+        if _file is None:
+            return
+        _file.write(line)
+        now = time.monotonic()
+        if now - _flushed_ts >= FLUSH_INTERVAL:  # Readable up to here if killed
+            _flushed_ts = now
+            _file.flush()
+
+
+def record(server, start_ts, latency, rsp=None, error=None):
+    item = {"ts": start_ts / 1000, "provider": server["name"], "codes": server["codes_str"], "ms": latency}
+    if rsp is not None:
+        item["status"] = rsp.status_code
+        item["encoding"] = rsp.encoding
+        item["body"] = rsp.content.decode("latin-1")
+    else:
+        item["error"] = error
+    _write(item)
+
+
+def close():
+    global Active, _file
+    with _lock:
+        Active = False
+        if _file:
+            _file.close()
+            _file = None
+
+
+# Header and request lines of a capture
+def load(path):
+    lines = []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                if line.endswith("\n"):
+                    lines.append(json.loads(line))
+        except EOFError:
+            pass  # The runner was killed, flushed lines are kept
+    if not lines or "config" not in lines[0]:
+        raise ValueError(f"{path} is not a capture")
+    return lines[0], lines[1:]
@@ -0,0 +1,146 @@
+import time
+
+import quotes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# Alert rules compiled to one threshold per symbol, evaluated over the whole
+# quote list at once. Config:
+#   "threshold": {"indices": [...], "up": 7, "down": 5}
+#   "rules": {
+#     "overrides": {"600519": {"up": 3, "down": 3}, "i:000001": {"up": 1}},
+#     "rearm": 1,        percent points back inside a threshold to alert again
+#     "cooldown": 600    seconds between two alerts of a symbol
+#   }
+# Without "rearm" a symbol alerts once a day, as it always did.
+
+UP = 1
+DOWN = -1
+
+# Highlight classes published with the quotes, as indices into CLASSES
+EVEN = 0
+RISE = 1
+FALL = 2
+UP_HL = 3
+DOWN_HL = 4
+CLASSES = ("stk_even", "stk_up", "stk_down", "stk_up_hl", "stk_down_hl")
+
+
+class Engine:
+    def __init__(self, config, keys, fired=()):
+        threshold = config["threshold"]
+        rules = config.get("rules", {})
+        overrides = rules.get("overrides", {})
+        indices = len(config["indices"])
+        up = []
+        down = []
+        for i, key in enumerate(keys):
+            if i < indices:
+                default = {"up": threshold["indices"][i], "down": threshold["indices"][i]}
+            else:
+                default = threshold
+            override = overrides.get(key, {})
+            up.append(override.get("up", default["up"]))
+            down.append(-override.get("down", default["down"]))
+
+        self.keys = list(keys)
+        self.rearm = rules.get("rearm")
+        self.cooldown = rules.get("cooldown", 0)
+        count = len(keys)
+        if numpy:
+            self.up = numpy.array(up, float)
+            self.down = numpy.array(down, float)
+            self.fired = numpy.zeros(count, bool)
+            self.last = numpy.full(count, -numpy.inf)
+        else:
+            self.up = up
+            self.down = down
+            self.fired = [False] * count
+            self.last = [float("-inf")] * count
+        self.reset(fired)
+
+    def reset(self, fired=()):
+        for i in range(len(self.keys)):
+            self.fired[i] = False
+        for i in fired:
+            if i < len(self.keys):
+                self.fired[i] = True
+
+    # Sorted indices of the symbols that alerted and are not re-armed yet
+    def notified(self):
+        if numpy:
+            return numpy.flatnonzero(self.fired).tolist()
+        return [i for i, f in enumerate(self.fired) if f]
+
+    # Least distance of the quotes of `table` to a threshold not fired yet,
+    # `positions` are their indices in the keys
+    def headroom(self, table, positions):
+        least = float("inf")
+        for value, state, i in zip(table.numbers, table.status, positions):
+            if state <= quotes.INT and not self.fired[i]:
+                least = min(least, self.up[i] - value, value - self.down[i])
+        return least
+
+    # Highlight class of every quote of `table`, placeholders are even
+    def classes(self, table):
+        if numpy:
+            current = table.array()
+            result = numpy.where(current > 0, RISE, numpy.where(current < 0, FALL, EVEN))
+            result[(current > 0) & (current >= self.up)] = UP_HL
+            result[(current <= 0) & (current <= self.down)] = DOWN_HL
+            return result.tolist()
+        result = []
+        for i, value in enumerate(table.values()):
+            if type(value) not in (int, float):
+                result.append(EVEN)
+            elif value > 0:
+                result.append(UP_HL if value >= self.up[i] else RISE)
+            elif value <= self.down[i]:
+                result.append(DOWN_HL)
+            else:
+                result.append(FALL if value < 0 else EVEN)
+        return result
+
+    # [(index, UP or DOWN)] of new alerts in `table`, fired ones are remembered
+    def evaluate(self, table, now=None):
+        now = time.time() if now is None else now
+        if numpy:
+            return self._evaluateArrays(table.array(), now)
+        return self._evaluateLists(table.values(), now)
+
+    def _evaluateArrays(self, current, now):
+        ups = (current > 0) & (current >= self.up)
+        downs = (current <= 0) & (current <= self.down)
+        hits = (ups | downs) & ~self.fired & (now - self.last >= self.cooldown)
+        if self.rearm is not None:
+            calm = (current < self.up - self.rearm) & (current > self.down + self.rearm)
+            self.fired &= ~calm
+        alerts = numpy.flatnonzero(hits)
+        self.fired[alerts] = True
+        self.last[alerts] = now
+        return [(i, UP if ups[i] else DOWN) for i in alerts.tolist()]
+
+    def _evaluateLists(self, values, now):
+        alerts = []
+        fired = self.fired
+        for i, value in enumerate(values):
+            if type(value) not in (int, float):
+                continue
+            if fired[i]:
+                if self.rearm is not None and self.down[i] + self.rearm < value < self.up[i] - self.rearm:
+                    fired[i] = False
+                continue
+            if now - self.last[i] < self.cooldown:
+                continue
+            if value > 0 and value >= self.up[i]:
+                alerts.append((i, UP))
+            elif value <= 0 and value <= self.down[i]:
+                alerts.append((i, DOWN))
+            else:
+                continue
+            fired[i] = True
+            self.last[i] = now
+        return alerts
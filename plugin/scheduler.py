@@ -0,0 +1,165 @@
+import json
+import os
+import random
+import statistics
+import threading
+import time
+
+ALPHA = 0.2  # Weight of the latest sample in moving averages
+FAILURE_LIMIT = 3  # Contiguous failures to trip the breaker
+COOL_OFF = 60  # seconds, doubled on each failed probe
+COOL_OFF_MAX = 1800
+STALE_LIMIT = 0.5  # Moving average of stale responses to flag a provider
+SAVE_INTERVAL = 60
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half-open"
+
+Stats = {}
+_lock = threading.Lock()
+_saved_ts = 0
+
+
+def _new():
+    return {
+        "latency": None,  # ms, moving average
+        "fail_rate": 0.0,  # moving average of parse failures and http errors
+        "ok": 0,
+        "parse_errors": 0,
+        "http_errors": 0,
+        "failures": 0,  # contiguous
+        "state": CLOSED,
+        "cool_off": COOL_OFF,
+        "open_until": 0,
+        "probing": False,
+        "stale": 0,  # responses older than quotes already held
+        "stale_rate": 0.0,
+    }
+
+
+def stat(name):
+    st = Stats.get(name)
+    if st is None:
+        st = Stats[name] = _new()
+    return st
+
+
+def load(path):
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            saved = json.load(f)
+    except Exception:
+        return
+    with _lock:
+        for name, st in saved.items():
+            Stats[name] = {**_new(), **st, "probing": False}
+
+
+def save(path, force=False):
+    global _saved_ts
+    now = time.time()
+    if not force and now - _saved_ts < SAVE_INTERVAL:
+        return
+    _saved_ts = now
+    with _lock:
+        text = json.dumps(Stats)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+# outcome: "ok", "parse" (bad payload) or "http" (status, timeout, connection)
+def record(name, latency, outcome):
+    with _lock:
+        st = stat(name)
+        if latency is not None:
+            st["latency"] = (
+                latency
+                if st["latency"] is None
+                else ALPHA * latency + (1 - ALPHA) * st["latency"]
+            )
+        failed = outcome != "ok"
+        st["fail_rate"] = ALPHA * failed + (1 - ALPHA) * st["fail_rate"]
+        st["probing"] = False
+        if not failed:
+            st["ok"] += 1
+            st["failures"] = 0
+            st["state"] = CLOSED
+            st["cool_off"] = COOL_OFF
+            return
+
+        st["parse_errors" if outcome == "parse" else "http_errors"] += 1
+        st["failures"] += 1
+        if st["state"] == HALF_OPEN:  # Probe failed
+            st["cool_off"] = min(st["cool_off"] * 2, COOL_OFF_MAX)
+            st["state"] = OPEN
+        elif st["failures"] >= FAILURE_LIMIT:
+            st["state"] = OPEN
+        if st["state"] == OPEN:
+            st["open_until"] = time.time() + st["cool_off"]
+
+
+# A picked server whose request never started, a half-open one may be probed again
+def release(name):
+    with _lock:
+        stat(name)["probing"] = False
+
+
+# A response carrying older quotes than held counts against the provider,
+# returns True when it just crossed STALE_LIMIT
+def stale(name, isStale=True):
+    with _lock:
+        st = stat(name)
+        before = st["stale_rate"]
+        st["stale_rate"] = ALPHA * isStale + (1 - ALPHA) * before
+        if isStale:
+            st["stale"] += 1
+            st["fail_rate"] = ALPHA + (1 - ALPHA) * st["fail_rate"]
+        return before < STALE_LIMIT <= st["stale_rate"]
+
+
+def available(servers):
+    now = time.time()
+    result = []
+    with _lock:
+        for server in servers:
+            st = stat(server["name"])
+            if st["state"] == OPEN and now >= st["open_until"]:
+                st["state"] = HALF_OPEN
+            if st["state"] == CLOSED:
+                result.append(server)
+            elif st["state"] == HALF_OPEN and not st["probing"]:
+                result.append(server)  # A single probe at a time
+    return result
+
+
+# Unknown ones are taken for as fast as the median measured one, `prior`
+def weight(name, prior=500):
+    st = stat(name)
+    latency = st["latency"] if st["latency"] is not None else prior
+    return (1 - st["fail_rate"]) ** 2 / max(latency, 1)
+
+
+def prior(servers):
+    measured = [stat(s["name"])["latency"] for s in servers if stat(s["name"])["latency"] is not None]
+    return statistics.median(measured) if measured else 500
+
+
+# Weighted sampling without replacement, healthy and fast ones are favored
+def pick(servers, count=1):
+    candidates = available(servers) or list(servers)  # Never starve the runner
+    chosen = []
+    guess = prior(candidates)
+    while candidates and len(chosen) < count:
+        weights = [weight(s["name"], guess) + 1e-9 for s in candidates]
+        server = random.choices(candidates, weights)[0]
+        candidates.remove(server)
+        chosen.append(server)
+    with _lock:
+        for server in chosen:
+            st = stat(server["name"])
+            if st["state"] == HALF_OPEN:
+                st["probing"] = True
+    return chosen
@@ -1,9 +1,47 @@
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import json
 import random
+import re
 
 NAME_PLACEHOLDER = '?'
 VAL_PLACEHOLDER = '-'
+EXCHANGE_TZ = timezone(timedelta(hours=8))  # Times in responses, whatever the machine runs on
+
+# Parsers fill the slots of `server["codes"]` in a quotes.QuoteTable from
+# `offset` on and return how many they filled. They leave the exchange time
+# of the newest quote in `server["source_ts"]` (epoch seconds) when every
+# quote of the response carries one, else None.
+
+
+# Helpers of the bytes parsers below, they work on `rsp.content` without
+# the `rsp.text` round trip and only decode the names, results are identical
+# to the text ones, see bench/parity.py. A server uses its bytes parser when
+# "bytes_faster", the "bytes_parser" config overrides that for all.
+def _encoding(rsp):
+    return rsp.encoding or rsp.apparent_encoding  # Same as `rsp.text`
+
+
+def _loads(raw, rsp):
+    encoding = _encoding(rsp).lower().replace("_", "-")
+    if encoding in ("utf-8", "utf8", "ascii"):
+        return json.loads(raw)  # The C decoder reads UTF-8 bytes directly
+    return json.loads(raw.decode(encoding))
+
+
+# Digits of an exchange date time like "20250123150003" or "2025/01/23 16:08:00"
+def _stamp(digits):
+    if not digits or len(digits) < 14:
+        return None
+    if type(digits) is bytes:
+        digits = digits.decode()
+    return datetime.strptime(digits[:14], "%Y%m%d%H%M%S").replace(tzinfo=EXCHANGE_TZ).timestamp()
+
+
+# Newest of the stamps so far, None once a quote had none
+def _newest(newest, stamp):
+    if newest is None or not stamp:
+        return None
+    return max(newest, stamp)
 
 
 def _qq_code_converter(code, isIndex=False):
@@ -31,8 +69,9 @@ def _qq_code_converter(code, isIndex=False):
         return "bj" + code
 
 
-def _qq_rsp_parser(rsp, server, price):
-    data = []
+def _qq_rsp_parser(rsp, server, price, table, offset=0):
+    i = offset
+    newest = ""
     ls = rsp.text.split("\n")
     # print(ls)
     # import pdb; pdb.set_trace()
@@ -43,11 +82,52 @@ def _qq_rsp_parser(rsp, server, price):
         # import pdb; pdb.set_trace()
         title = slices[1]
         val = float(slices[3 if price else 32])
-        data.append([title[0:2], val])
-    return data
+        newest = _newest(newest, re.sub(r"\D", "", slices[30]) if len(slices) > 30 else None)
+        table.set(i, title[0:2], val)
+        i += 1
+    server["source_ts"] = _stamp(newest)
+    return i - offset
+
+
+# Trail bytes of GBK may equal `~`, such lines are matched by whole chars
+_qq_patterns = {
+    price: re.compile(
+        rb'="[^~\n]*~((?:[\x81-\xfe][\x40-\xfe]|[^~\n])*)~'
+        + (rb'[^~\n]*~' if price else rb'(?:[^~\n]*~){30}')
+        + rb'([^~\n]*)'
+    )
+    for price in (True, False)
+}
+
+
+def _qq_rsp_bytes_parser(rsp, server, price, table, offset=0):
+    i = offset
+    newest = b""
+    raw = rsp.content
+    encoding = _encoding(rsp)
+    ix = 3 if price else 32
+    for item in raw.split(b"\n"):
+        if item == b"":
+            continue
+        slices = item[item.index(b"=") + 2:].split(b"~", 33)
+        try:
+            title = slices[1].decode(encoding)
+            stamp = slices[30].translate(None, b"/-: ") if len(slices) > 30 else None
+        except UnicodeDecodeError:
+            match = _qq_patterns[bool(price)].search(item)
+            title = match.group(1).decode(encoding)
+            rest = item[match.end(1) + 1:].split(b"~", 29)  # Fields after the name
+            stamp = rest[28].translate(None, b"/-: ") if len(rest) > 28 else None
+            slices = (None,) * ix + (match.group(2),)
+        newest = _newest(newest, stamp)
+        table.set(i, title[0:2], float(slices[ix]))
+        i += 1
+    server["source_ts"] = _stamp(newest)
+    return i - offset
 
 
 qq = {
+    'name': 'qq',
     'url_formatter': lambda codes:
     f"https://qt.gtimg.cn/r=0.{random.randint(10**15, 10**16 - 1)}&q={codes}",
     'headers': {
@@ -55,7 +135,11 @@ qq = {
     },
     'code_converter': _qq_code_converter,
     'rsp_parser': _qq_rsp_parser,
+    'rsp_bytes_parser': _qq_rsp_bytes_parser,
+    'bytes_faster': True,  # Measured with bench/bench_pipeline.py
     'has_price': True,
+    'has_name': True,
+    'max_symbols': 60,  # per request
 }
 
 
@@ -84,8 +168,9 @@ def _sina_code_converter(code, isIndex=False):
         return "s_bj" + code
 
 
-def _sina_rsp_parser(rsp, server, price):
-    data = []
+def _sina_rsp_parser(rsp, server, price, table, offset=0):
+    i = offset
+    newest = ""
     ls = rsp.text.split("\n")
     # print(ls)
     # import pdb; pdb.set_trace()
@@ -93,6 +178,10 @@ def _sina_rsp_parser(rsp, server, price):
         if item == "":
             continue
         slices = item.split("=")[1][1:].split(",")
+        if len(slices) > 18:  # rt_hk, date and time at the end
+            newest = _newest(newest, re.sub(r"\D", "", slices[17] + slices[18]) + "00")
+        else:
+            newest = None  # The s_ list has no time
         if len(slices) > 8:
             title = slices[1]
             val = float(slices[6 if price else 8])
@@ -102,11 +191,42 @@ def _sina_rsp_parser(rsp, server, price):
                 val = VAL_PLACEHOLDER  # non-support
             else:
                 val = float(slices[1 if price else 3])
-        data.append([title[0:2], val])
-    return data
+        table.set(i, title[0:2], val)
+        i += 1
+    server["source_ts"] = _stamp(newest)
+    return i - offset
+
+
+def _sina_rsp_bytes_parser(rsp, server, price, table, offset=0):
+    i = offset
+    newest = b""
+    raw = rsp.content
+    encoding = _encoding(rsp)
+    for item in raw.split(b"\n"):
+        if item == b"":
+            continue
+        slices = item.split(b"=")[1][1:].split(b",")
+        if len(slices) > 18:  # rt_hk, date and time at the end
+            newest = _newest(newest, (slices[17] + slices[18]).translate(None, b"/-: ") + b"00")
+        else:
+            newest = None  # The s_ list has no time
+        if len(slices) > 8:
+            title = slices[1]
+            val = float(slices[6 if price else 8])
+        else:
+            title = slices[0]
+            if float(slices[1]) == 0:
+                val = VAL_PLACEHOLDER  # non-support
+            else:
+                val = float(slices[1 if price else 3])
+        table.set(i, title.decode(encoding)[0:2], val)
+        i += 1
+    server["source_ts"] = _stamp(newest)
+    return i - offset
 
 
 sina = {
+    'name': 'sina',
     'url_formatter': lambda codes:
     f"https://hq.sinajs.cn/rn={round(datetime.now().timestamp()*1000)}&list={codes}",
     'headers': {
@@ -114,7 +234,11 @@ sina = {
     },
     'code_converter': _sina_code_converter,
     'rsp_parser': _sina_rsp_parser,
+    'rsp_bytes_parser': _sina_rsp_bytes_parser,
+    'bytes_faster': False,
     'has_price': True,
+    'has_name': True,
+    'max_symbols': 80,  # per request
 }
 
 
@@ -139,24 +263,46 @@ def _east_code_converter(code, isIndex=False):
         return "0." + code
 
 
-def _east_rsp_parser(rsp, server, price):
-    data = []
+# f124 is the update time in epoch seconds, "-" when there is none
+def _east_source_ts(ls):
+    stamps = [item.get('f124') for item in ls]
+    if not stamps or not all(type(ts) is int for ts in stamps):
+        return None
+    return max(stamps)
+
+
+def _east_rsp_parser(rsp, server, price, table, offset=0):
     ls = json.loads(rsp.text[28:-2])['data']['diff']
     # import pdb; pdb.set_trace()
-    for item in ls:
-        data.append([item['f14'], item['f2' if price else 'f3']])
-    return data
+    for i, item in enumerate(ls, offset):
+        table.set(i, item['f14'], item['f2' if price else 'f3'])
+    server["source_ts"] = _east_source_ts(ls)
+    return len(ls)
+
+
+def _east_rsp_bytes_parser(rsp, server, price, table, offset=0):
+    ls = _loads(rsp.content[28:-2], rsp)['data']['diff']
+    key = 'f2' if price else 'f3'
+    server["source_ts"] = _east_source_ts(ls)
+    for i, item in enumerate(ls, offset):
+        table.set(i, item['f14'], item[key])
+    return len(ls)
 
 
 east = {
+    'name': 'east',
     'url_formatter': lambda codes:
-    f"https://push2.eastmoney.com/api/qt/ulist.np/get?fltt=2&secids={codes}&fields=f2,f3,f14&cb=qa_wap_jsonpCB1737645019281",
+    f"https://push2.eastmoney.com/api/qt/ulist.np/get?fltt=2&secids={codes}&fields=f2,f3,f14,f124&cb=qa_wap_jsonpCB1737645019281",
     'headers': {
         "Referer": "https://guba.eastmoney.com/"
     },
     'code_converter': _east_code_converter,
     'rsp_parser': _east_rsp_parser,
+    'rsp_bytes_parser': _east_rsp_bytes_parser,
+    'bytes_faster': False,
     'has_price': True,
+    'has_name': True,
+    'max_symbols': 100,  # per request
 }
 
 
@@ -185,20 +331,39 @@ def _xq_code_converter(code, isIndex=False):
         return "BJ" + code
 
 
-def _xq_rsp_parser(rsp, server, price):
-    data = []
+def _xq_rsp_parser(rsp, server, price, table, offset=0):
     ls = json.loads(rsp.text)['data']
     # print(ls)
     # import pdb; pdb.set_trace()
     dataDict = {}
     for item in ls:
         dataDict[item['symbol']] = item['current' if price else 'percent']
-    for code in server['codes']:
-        data.append([NAME_PLACEHOLDER, dataDict[code]])
-    return data
+    for i, code in enumerate(server['codes'], offset):
+        table.setValue(i, dataDict[code])
+    server["source_ts"] = _xq_source_ts(ls)
+    return len(server['codes'])
+
+
+# `timestamp` is in ms
+def _xq_source_ts(ls):
+    stamps = [item.get('timestamp') for item in ls]
+    if not stamps or None in stamps:
+        return None
+    return max(stamps) / 1000
+
+
+def _xq_rsp_bytes_parser(rsp, server, price, table, offset=0):
+    key = 'current' if price else 'percent'
+    ls = _loads(rsp.content, rsp)['data']
+    dataDict = {item['symbol']: item[key] for item in ls}
+    server["source_ts"] = _xq_source_ts(ls)
+    for i, code in enumerate(server['codes'], offset):
+        table.setValue(i, dataDict[code])
+    return len(server['codes'])
 
 
 xq = {
+    'name': 'xq',
     'url_formatter': lambda codes:
     f"https://stock.xueqiu.com/v5/stock/realtime/quotec.json?symbol={codes}",
     'headers': {
@@ -206,7 +371,11 @@ xq = {
     },
     'code_converter': _xq_code_converter,
     'rsp_parser': _xq_rsp_parser,
+    'rsp_bytes_parser': _xq_rsp_bytes_parser,
+    'bytes_faster': False,
     'has_price': True,
+    'has_name': False,
+    'max_symbols': 50,  # per request
 }
 
 
@@ -235,20 +404,27 @@ def _cls_code_converter(code, isIndex=False):
         return code + ".BJ"
 
 
-def _cls_rsp_parser(rsp, server, _):
-    data = []
+def _cls_rsp_parser(rsp, server, _, table, offset=0):
     dc = json.loads(rsp.text)['data']
     # print(ls)
     # import pdb; pdb.set_trace()
-    for code in server['codes']:
+    for i, code in enumerate(server['codes'], offset):
         if code in dc:
-            data.append([NAME_PLACEHOLDER, round(dc[code] * 100, 2)])
+            table.setValue(i, round(dc[code] * 100, 2))
         else:
-            data.append([NAME_PLACEHOLDER, VAL_PLACEHOLDER])
-    return data
+            table.setValue(i, VAL_PLACEHOLDER)
+    return len(server['codes'])
+
+
+def _cls_rsp_bytes_parser(rsp, server, _, table, offset=0):
+    dc = _loads(rsp.content, rsp)['data']
+    for i, code in enumerate(server['codes'], offset):
+        table.setValue(i, round(dc[code] * 100, 2) if code in dc else VAL_PLACEHOLDER)
+    return len(server['codes'])
 
 
 cls = {
+    'name': 'cls',
     'url_formatter': lambda codes:
     f"https://x-quote.cls.cn/quote/stock/refresh?secu_codes={codes}&app=CailianpressWeb&os=web&sv=8.4.6&sign=9f8797a1f4de66c2370f7a03990d2737",
     'headers': {
@@ -256,7 +432,11 @@ cls = {
     },
     'code_converter': _cls_code_converter,
     'rsp_parser': _cls_rsp_parser,
+    'rsp_bytes_parser': _cls_rsp_bytes_parser,
+    'bytes_faster': False,
     'has_price': False,
+    'has_name': False,
+    'max_symbols': 50,  # per request
 }
 
 
@@ -267,19 +447,29 @@ def _sohu_code_converter(code, isIndex=False):
         return 'cn_' + code
 
 
-def _sohu_rsp_parser(rsp, server, price):
-    data = []
+def _sohu_rsp_parser(rsp, server, price, table, offset=0):
     ls = json.loads(rsp.text[10:-3])[1:]
     # import pdb; pdb.set_trace()
-    for item in ls:
+    for i, item in enumerate(ls, offset):
+        if len(item):
+            table.set(i, item[1], item[2] if price else float(item[3][0:-1]))
+        else:
+            table.set(i, NAME_PLACEHOLDER, VAL_PLACEHOLDER)
+    return len(ls)
+
+
+def _sohu_rsp_bytes_parser(rsp, server, price, table, offset=0):
+    ls = _loads(rsp.content[10:-3], rsp)
+    for i, item in enumerate(ls[1:], offset):
         if len(item):
-            data.append([item[1], item[2] if price else float(item[3][0:-1])])
+            table.set(i, item[1], item[2] if price else float(item[3][0:-1]))
         else:
-            data.append([NAME_PLACEHOLDER, VAL_PLACEHOLDER])
-    return data
+            table.set(i, NAME_PLACEHOLDER, VAL_PLACEHOLDER)
+    return len(ls) - 1
 
 
 sohu = {
+    'name': 'sohu',
     'url_formatter': lambda codes:
     f"http://s.m.sohu.com/newstocklistq?code={codes}&_={round(datetime.now().timestamp()*1000)}",
     'headers': {
@@ -287,6 +477,10 @@ sohu = {
     },
     'code_converter': _sohu_code_converter,
     'rsp_parser': _sohu_rsp_parser,
+    'rsp_bytes_parser': _sohu_rsp_bytes_parser,
+    'bytes_faster': False,
     'has_price': True,
+    'has_name': True,
+    'max_symbols': 50,  # per request
 }
 Servers = (east, qq, sina, xq, cls, sohu)
@@ -0,0 +1,78 @@
+import socket
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
+DNS_TTL = 300  # seconds
+POOL_SIZE = 4
+
+_sessions = {}
+_lock = threading.Lock()
+_dns_cache = {}
+_getaddrinfo = socket.getaddrinfo
+
+
+def _cached_getaddrinfo(host, port, *args, **kwargs):
+    key = (host, port, args, tuple(sorted(kwargs.items())))
+    now = time.monotonic()
+    hit = _dns_cache.get(key)
+    if hit and hit[0] > now:
+        return hit[1]
+    res = _getaddrinfo(host, port, *args, **kwargs)
+    _dns_cache[key] = (now + DNS_TTL, res)
+    return res
+
+
+def install(pool_size=POOL_SIZE, dns_ttl=DNS_TTL):
+    global POOL_SIZE, DNS_TTL
+    POOL_SIZE = pool_size
+    DNS_TTL = dns_ttl
+    socket.getaddrinfo = _cached_getaddrinfo
+
+
+# One keep-alive session per provider, the pool bounds parallel connections
+def get(server):
+    session = _sessions.get(server["name"])
+    if session is None:
+        with _lock:
+            session = _sessions.get(server["name"])
+            if session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(
+                    pool_connections=1, pool_maxsize=POOL_SIZE, pool_block=True
+                )
+                session.mount("http://", adapter)
+                session.mount("https://", adapter)
+                session.headers.update({**server["headers"], "User-Agent": USER_AGENT})
+                _sessions[server["name"]] = session
+    return session
+
+
+# Resolve hosts and open connections ahead of the first real tick
+def warmUp(servers, timeout=5):
+    def touch(server):
+        try:
+            get(server).get(server["url_formatter"](server["codes_str"]), timeout=timeout)
+            return None
+        except Exception as er:
+            return f"{server['name']}: {repr(er)}"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda s=server: results.append(touch(s)), daemon=True)
+        for server in servers
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(timeout + 1)
+    return [r for r in results if r]
+
+
+def closeAll():
+    with _lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
@@ -0,0 +1,125 @@
+import json
+import os
+
+from quotes import QuoteTable, jsonable
+
+# The data file holds newline-delimited records, a full base snapshot
+# followed by deltas that only carry what changed since the previous one:
+#   {"seq": 1, "base": {...}}
+#   {"seq": 2, "prev": 1, "set": {key: value}, "delta": {key: {"index": item}}}
+# Readers keep their offset and apply new lines, a record whose `prev` is not
+# their `seq` means the file was compacted, so they read it from the start.
+
+COMPACT_EVERY = 300  # deltas
+
+
+def _copy(data):
+    return {
+        k: list(v) if type(v) is list else v.copy() if type(v) is QuoteTable else v
+        for k, v in data.items()
+    }
+
+
+def diff(old, new):
+    changes = {}
+    sets = {}
+    for key, value in new.items():
+        prev = old.get(key)
+        if type(value) is QuoteTable and type(prev) is QuoteTable and value.keys == prev.keys:
+            changed = value.changed(prev)
+            if len(changed) > len(value) // 2:
+                sets[key] = value
+            elif changed:
+                changes[key] = {str(i): value[i] for i in changed}
+        elif type(value) is list and type(prev) is list and len(value) == len(prev):
+            changed = {str(i): v for i, v in enumerate(value) if v != prev[i]}
+            if len(changed) > len(value) // 2:
+                sets[key] = value
+            elif changed:
+                changes[key] = changed
+        elif key not in old or value != prev:
+            sets[key] = value
+    return sets, changes
+
+
+def apply(data, record):
+    if "base" in record:
+        return record["base"]
+    data.update(record.get("set", {}))
+    for key, changed in record.get("delta", {}).items():
+        items = data[key]
+        for i, value in changed.items():
+            items[int(i)] = value
+    return data
+
+
+# Full state of a data file, older single document files are accepted too
+def load(text):
+    seq = None
+    data = {}
+    for line in text.splitlines():
+        if not line:
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            break  # Torn by a killed writer
+        if "seq" not in record:
+            return None, record
+        if "base" not in record and record.get("prev") != seq:
+            break  # Partly written or stale tail
+        data = apply(data, record)
+        seq = record["seq"]
+    return seq, data
+
+
+def dump(data, seq=0):
+    return json.dumps({"seq": seq, "base": data}, ensure_ascii=False, default=jsonable) + "\n"
+
+
+class Writer:
+    def __init__(self, f, compact_every=COMPACT_EVERY, seq=0):
+        self.f = f
+        self.compact_every = compact_every
+        self.seq = seq
+        self.data = None
+        self.deltas = 0
+
+    # Record to write for `data`, None if nothing changed
+    def record(self, data):
+        if self.data is None:
+            return {"seq": self.seq + 1, "base": data}
+        sets, changes = diff(self.data, data)
+        if not sets and not changes:
+            return None
+        if self.deltas >= self.compact_every:
+            return {"seq": self.seq + 1, "base": data}
+        record = {"seq": self.seq + 1, "prev": self.seq}
+        if sets:
+            record["set"] = sets
+        if changes:
+            record["delta"] = changes
+        return record
+
+    def write(self, record, data):
+        line = json.dumps(record, ensure_ascii=False, default=jsonable) + "\n"
+        if "base" in record:
+            self.f.seek(0)
+            self.f.write(line)
+            self.f.truncate()
+            self.deltas = 0
+        else:
+            self.f.seek(0, os.SEEK_END)
+            self.f.write(line)
+            self.deltas += 1
+        self.f.flush()
+        self.seq = record["seq"]
+        self.data = _copy(data)
+        return line
+
+    def publish(self, data):
+        record = self.record(data)
+        if record is None:
+            return False
+        self.write(record, data)
+        return True
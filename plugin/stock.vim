@@ -10,8 +10,6 @@ hi stk_down_hl guifg='#268bdc'
 hi stk_even guifg='#586e6b'
 
 let s:VAL_PLACEHOLDER = '-'
-let s:stk_sep1 = '/'
-let s:stk_sep2 = '|'
 
 let s:stk_folder = $HOME . '/.stock'
 if !isdirectory(s:stk_folder)
@@ -21,12 +19,22 @@ endif
 
 let s:stk_config_path = s:stk_folder . '/cfg/stock.cfg.json'
 let g:stk_data_path = s:stk_folder. '/stock.dat.json'
-let s:stk_data_lock_path = s:stk_folder . '/stock.dat.lock'
+let g:stk_shm_path = s:stk_folder . '/stock.dat.shm'
+let g:stk_plugin_dir = expand('<sfile>:p:h')
 let s:stk_runner_pid_path = s:stk_folder . '/stock.runner.pid'
+let s:stk_stale_path = s:stk_folder . '/stock.stale.log'
 let s:stk_runner_path = expand('<sfile>:p:h') . "/stock_runner.py"
+let s:stk_query_path = expand('<sfile>:p:h') . "/stock_query.py"
+let s:stk_query_addr_path = s:stk_folder . '/stock.query.addr'
+let g:stk_calendar_path = s:stk_folder . '/calendar.json'
 let s:stk_config = {}
 let s:stk_delay = 0
 let g:stk_last_read_time = 0
+let s:stk_heartbeat = 0
+let s:stk_pub_addr_path = s:stk_folder . '/stock.pub.addr'
+let s:stk_channel = 0
+let s:stk_pending = ''
+let s:stk_watchdog = 30000 "Timer period while quotes are pushed
 let s:stk_cfg_ts = 0
 let s:stk_timer = 0
 let s:stk_retry = 0
@@ -99,22 +107,84 @@ function OpenDataFile()
     end
 end
 
--- Function to read the whole content of the file
+-- Snapshot kept in sync with the data file, see snapshot.py for the format
+local snapshot = {seq = nil, offset = 0, data = vim.empty_dict()}
 
-function ReadDataInner()
+-- State pushed by the runner's publisher, same records as the data file
+local pushed = {seq = nil, data = vim.empty_dict()}
+
+local function ResetSnapshot()
+    snapshot.seq = nil
+    snapshot.offset = 0
+    snapshot.data = vim.empty_dict()
+end
+
+local function ApplyRecord(state, record)
+    if record.seq == nil then
+        return false
+    elseif record.base ~= nil then
+        state.data = record.base
+    elseif record.prev == state.seq then
+        for key, value in pairs(record.set or {}) do
+            state.data[key] = value
+        end
+        for key, changed in pairs(record.delta or {}) do
+            local items = state.data[key]
+            for i, value in pairs(changed) do
+                items[tonumber(i) + 1] = value
+            end
+        end
+    else
+        return false
+    end
+    state.seq = record.seq
+    return true
+end
+
+-- Data after applying a pushed line, nil when out of sync
+function ApplyPublished(line)
+    local ok, record = pcall(vim.fn.json_decode, line)
+    if not (ok and type(record) == "table" and ApplyRecord(pushed, record)) then
+        pushed.seq = nil
+        return nil
+    end
+    return pushed.data
+end
+
+-- Apply the records appended since the last read, start over when compacted
+function ReadDataInner(retried)
     if not file_handle then
         OpenDataFile()
     end
 
-    if file_handle then
-        file_handle:seek("set")
-        data = file_handle:read("*all")
-        -- print(data)
-        return data
-    else
+    if not file_handle then
         vim.api.nvim_command('call s:LogErr("File handle not available")')
-        return ""
+        return vim.empty_dict()
     end
+
+    if file_handle:seek("end") < snapshot.offset then
+        ResetSnapshot()
+    end
+    file_handle:seek("set", snapshot.offset)
+    local content = file_handle:read("*all") or ""
+    local pos = 1
+    while true do
+        local stop = content:find("\n", pos, true)
+        if not stop then
+            break -- Partly written line, left for the next read
+        end
+        local ok, record = pcall(vim.fn.json_decode, content:sub(pos, stop - 1))
+        if not (ok and type(record) == "table" and ApplyRecord(snapshot, record)) then
+            if retried then
+                break
+            end
+            ResetSnapshot()
+            return ReadDataInner(true)
+        end
+        snapshot.offset = snapshot.offset + stop - pos + 1
+        pos = stop + 1
+    end
+    return snapshot.data
 end
 
 function CloseDataInner()
@@ -122,23 +192,115 @@ function CloseDataInner()
         file_handle:close()
         file_handle = nil
     end
+    ResetSnapshot()
 end
 
-function GetMidnight()
-  -- Get the current time
-  local now = os.time()
+-- Highlight groups of the classes published by the runner, see rules.CLASSES
+local CLASSES = {[0] = 'stk_even', 'stk_up', 'stk_down', 'stk_up_hl', 'stk_down_hl'}
+local SEP1, SEP2 = '/', '|'  -- After the indices, the third one ends a group
+local segments = {}  -- Statusline text of every quote at the last render
+local output = ''
 
-  -- Get the current date components
-  local date_table = os.date("*t", now)
+-- Class of a quote from a runner publishing none, by its sign only
+local function Classify(value)
+    if type(value) ~= 'number' or value == 0 then
+        return 0
+    end
+    return value > 0 and 1 or 2
+end
+
+-- Statusline text of `prices`, only quotes whose value or class changed are built again
+function RenderPrices(prices, hl, countIndices)
+    local changed = #prices ~= #segments
+    for i, quote in ipairs(prices) do
+        local name, value = quote[1], quote[2]
+        local class = hl[i] or Classify(value)
+        local segment = segments[i]
+        if not segment or segment.value ~= value or segment.class ~= class or segment.name ~= name then
+            local text = (type(value) == 'number' or type(value) == 'string') and tostring(value) or '-'
+            if i > countIndices then
+                text = name .. text
+            end
+            text = '%#' .. CLASSES[class] .. '#' .. text
+            if i <= countIndices then
+                text = text .. '%#stk_even#' .. (i == 3 and SEP2 or SEP1)
+            end
+            segments[i] = {name = name, value = value, class = class, text = text}
+            changed = true
+        end
+    end
+    if changed then
+        for i = #prices + 1, #segments do
+            segments[i] = nil
+        end
+        local parts = {}
+        for i, segment in ipairs(segments) do
+            parts[i] = segment.text
+        end
+        output = table.concat(parts)
+    end
+    return output
+end
+
+-- Asks the runner over its query socket, false if it has none. `timeout`
+-- (ms) outlasts a fetch of the runner, which would be repeated otherwise
+function QueryRunner(query, addrPath, timeout)
+    local f = io.open(addrPath, 'r')
+    if not f then
+        return false
+    end
+    local mode, address = (f:read('*l') or ''):match('^(%S+)%s+(%S+)$')
+    f:close()
+    if not mode then
+        return false
+    end
+
+    local handle, done
+    local function finish(reply)
+        if done then
+            return
+        end
+        done = true
+        if not handle:is_closing() then
+            handle:close()
+        end
+        vim.schedule(function()
+            if reply then
+                vim.fn.StkQueryReply(reply)
+            else
+                vim.fn.StkQueryFallback(query) -- Stale address, no runner
+            end
+        end)
+    end
 
-  -- Set the time components to midnight
-  date_table.hour = 0
-  date_table.min = 0
-  date_table.sec = 0
+    local function onConnect(err)
+        if err then
+            return finish(nil)
+        end
+        local buffer = ''
+        handle:write(query .. '\n')
+        handle:read_start(function(err, chunk)
+            if err or not chunk then
+                return finish(nil)
+            end
+            buffer = buffer .. chunk
+            local line = buffer:match('^([^\n]*)\n')
+            if line then
+                finish(line)
+            end
+        end)
+    end
 
-  -- Get the Unix timestamp for the start of the day
-  -- print(vim.inspect(date_table))
-  return os.time(date_table)
+    if mode == 'pipe' then
+        handle = vim.loop.new_pipe(false)
+        handle:connect(address, onConnect)
+    else
+        local host, port = address:match('^(.*):(%d+)$')
+        handle = vim.loop.new_tcp()
+        handle:connect(host, tonumber(port), onConnect)
+    end
+    vim.defer_fn(function() finish(nil) end, math.max(timeout or 0, 5000))
+    return true
 end
 
 function KillPid(pid)
@@ -152,19 +314,33 @@ end
 
 EOF
 
+python3 << EOF
+import sys
+import vim
+sys.path.insert(0, vim.eval('g:stk_plugin_dir'))
+import quotebuf
+import tradecal
+StkQuotes = quotebuf.Reader(vim.eval('g:stk_shm_path'))
+EOF
+
 function! s:CreateText(txt, hl)
   return "%#" . a:hl . '#' . a:txt
 endfunction
 
+"Header of the shared quote region, {} before any runner published
+function! s:ReadHeader()
+  let l:header = py3eval('StkQuotes.header()')
+  return type(l:header) == v:t_dict ? l:header : {}
+endfunction
+
 function! s:ReadData()
-  let l:content = luaeval('ReadDataInner()')
-  "call s:Log('data content: ' . l:content)
-  let g:stk_last_read_time = localtime()
-  if len(l:content) > 0
-    return json_decode(l:content)
-  else
-    return {}
+  let l:data = py3eval('StkQuotes.snapshot()')
+  if type(l:data) != v:t_dict
+    let l:data = luaeval('ReadDataInner()') "No shared region, read the data file
   endif
+  "call s:Log('data content: ' . string(l:data))
+  let g:stk_last_read_time = localtime()
+  return l:data
 endfunction
 
 function! s:ReadConfig()
@@ -181,6 +357,11 @@ function! s:ReadConfig()
 
     let s:stk_delay = (s:stk_config['delay'] + 1) * 1000
 
+    "Same calendar as the runner, cached in calendar.json
+    call py3eval(printf('tradecal.load(%s, %s, %s, tradecal.markets(%s))',
+          \ json_encode(g:stk_calendar_path), json_encode(s:stk_config['rest_dates']),
+          \ json_encode(get(s:stk_config, 'sessions', {})), json_encode(s:stk_config['indices'])))
+
     return 1
   else
     call s:Log("Config file non-exist: " . s:stk_config_path)
@@ -191,32 +372,9 @@ function! s:ReadConfig()
   endif
 endfunction
 
-function! s:InRestDay(...)
-  if a:0 == 0
-    let l:timestamp = localtime()
-  else
-    let l:timestamp = a:1
-  endif
-  let l:date = strftime("%Y-%m-%d", l:timestamp)
-
-  if !(str2nr(strftime("%w", l:timestamp)) % 6) || index(s:stk_config['rest_dates'], l:date) > -1
-    "call s:Log((a:0 == 0 ? 'Today' : l:date) . ' is a rest day')
-    return 1
-  else
-    return 0
-  endif
-endfunction
-
-function! s:FindNextOpenDay()
-  let l:timestamp = localtime()
-  let l:days = 0
-  while 1
-    let l:days += 1
-    let l:timestamp += 86400  "24 * 60 * 60
-    if !s:InRestDay(l:timestamp)
-      return l:days
-    endif
-  endwhile
+"Epoch seconds of the next session start
+function! s:NextOpen()
+  return float2nr(py3eval('tradecal.nextOpen().timestamp()'))
 endfunction
 
 function! s:handle_stderr(data)
@@ -268,9 +426,58 @@ function! s:StartRunner(check)
   endtry
 endfunction
 
+"Connect to the runner's publisher, quotes then arrive without polling
+function! s:Subscribe()
+  if s:stk_channel
+    return 1
+  endif
+  if !filereadable(s:stk_pub_addr_path)
+    return 0
+  endif
+  let [l:mode, l:address] = split(readfile(s:stk_pub_addr_path)[0])
+  try
+    let s:stk_channel = sockconnect(l:mode, l:address, {'on_data': function('s:OnPublish')})
+  catch
+    let s:stk_channel = 0
+  endtry
+  let s:stk_pending = ''
+  return s:stk_channel
+endfunction
+
+function! s:Unsubscribe()
+  if s:stk_channel
+    call chanclose(s:stk_channel)
+    let s:stk_channel = 0
+  endif
+endfunction
+
+function! s:OnPublish(channel, data, name)
+  if a:data == ['']
+    let s:stk_channel = 0 "Runner quit, the timers take over
+    return
+  endif
+  "The first item continues the last partial line, the last one is partial
+  let l:lines = copy(a:data)
+  let l:lines[0] = s:stk_pending . l:lines[0]
+  let s:stk_pending = remove(l:lines, -1)
+  for l:line in l:lines
+    let l:data = luaeval('ApplyPublished(_A)', l:line)
+    if type(l:data) != v:t_dict
+      call s:Unsubscribe() "Out of sync, a new subscription starts from a base
+      call s:Subscribe()
+      return
+    endif
+  endfor
+  if !empty(l:lines)
+    let g:stk_last_read_time = localtime()
+    call s:Render(l:data)
+  endif
+endfunction
+
 function! s:WaitDisplay(timer)
-  "call s:Log('WaitDisplay: ' . getftime(g:stk_data_path) . ' ' . s:stk_last_read_time)
-  if filereadable(g:stk_data_path) && getftime(g:stk_data_path) > g:stk_last_read_time && getfsize(g:stk_data_path) > 0
+  let l:header = s:ReadHeader()
+  "call s:Log('WaitDisplay: ' . string(l:header) . ' ' . g:stk_last_read_time)
+  if !empty(l:header) && l:header['ts'] > g:stk_last_read_time
     call s:DisplayPrices(0)
   else
     call s:Log('Update pending')
@@ -278,6 +485,24 @@ function! s:WaitDisplay(timer)
   endif
 endfunction
 
+function! s:Render(data)
+  if has_key(a:data, 'prices')
+    if type(a:data['prices']) == v:t_string
+      let l:error = "[STOCK] Error"
+      let g:stk_output = s:CreateText(l:error, 'ErrorMsg')
+      call s:LogErr("Runner: " . a:data['prices'])
+    elseif !empty(a:data['prices'])
+      "Classes come from the runner, unchanged quotes keep their text
+      let g:stk_output = luaeval('RenderPrices(_A[1], _A[2], _A[3])',
+            \ [a:data['prices'], get(a:data, 'hl', []), len(s:stk_config['indices'])])
+    else
+      call s:Log('Prices empty')
+    endif
+  else
+    call s:Log('No "Prices" key, no runner has published yet')
+  endif
+endfunction
+
 " a:timer = 0: called directly once rather than intermittently at market time  
 function! s:DisplayPrices(timer)
   "call s:Log('DisplayPrices')
@@ -287,203 +512,84 @@ function! s:DisplayPrices(timer)
     let s:stk_cfg_ts = l:tCfg
   endif
 
-  let l:tData = getftime(g:stk_data_path)
+  "The runner beats on every tick, even when quotes did not change
+  let l:header = s:ReadHeader()
+  let l:heartbeat = empty(l:header) ? 0 : l:header['heartbeat']
 
-  if !filereadable(s:stk_data_lock_path)
-    let l:tLock = 12345678901 ":locked: one more digit
-  else
-    let l:tLock = getftime(s:stk_data_lock_path)
-  endif
-  "call s:Log('Lock/Data: ' . l:tLock . '/' . l:tData . ' >' . (l:tLock > l:tData) . ' timer:' . a:timer)
-  if a:timer && l:tLock > l:tData
-    call s:Log('Data locked (if loop, runner quit abruptly, go to verify then call <leader>su...)')
-    let s:stk_timer = timer_start(1000, 's:DisplayPrices')
-    return
-  endif
-
-  "call s:Log('Data age: ' . string(localtime() - l:tData))
-  if a:timer && localtime() - l:tData > 60 " 1 min
+  "call s:Log('Data age: ' . string(localtime() - l:heartbeat))
+  if a:timer && localtime() - l:heartbeat > 60 " 1 min
     call s:Log("Data obsolete (runner crashed or wake from sleep)")
+    call writefile([localtime()], s:stk_stale_path, 'a') "Counted by the runner's metrics
     call StockRun()
     return
   end 
 
-  let l:updated = l:tData > g:stk_last_read_time
+  let l:updated = l:heartbeat > s:stk_heartbeat
+  "call s:Log('heartbeat now/last: ' . string(l:heartbeat) . ' ' . string(s:stk_heartbeat) . ' a:timer: ' . string(a:timer))
+  let s:stk_heartbeat = l:heartbeat
   let l:data = s:ReadData()
   "Only check runner if called in market time (by schedule) & data is not updated by runner
   let l:waiting = a:timer && !l:updated
-  "call s:Log('modified data/last: ' . string(l:tData) . ' ' . string(g:stk_last_read_time) . ' a:timer: ' . string(a:timer))
   if l:waiting
-    call s:Log('waiting: ' . string(l:tData) . ' ' . string(g:stk_last_read_time))
+    call s:Log('waiting: ' . string(l:heartbeat) . ' ' . string(g:stk_last_read_time))
     if !s:CheckRunner(1)
       call s:StartRunner(0)
       return
     endif
   else
-    if has_key(l:data, 'prices')
-      if type(l:data['prices']) == v:t_string
-        let l:error = "[STOCK] Error"
-        let g:stk_output = s:CreateText(l:error, 'ErrorMsg')
-        call s:LogErr("Runner: " . l:data['prices'])
-      elseif !empty(l:data['prices'])
-        let l:countIndices = len(s:stk_config['indices'])
-        let l:ix = 0
-        let l:text = ''
-
-        for [name, value] in l:data['prices']
-          if l:ix < l:countIndices
-            if type(value) == v:t_string "- when non-exist
-              let l:valueStr = value
-            else
-              let l:valueStr = string(value)
-            endif
-          else
-            let l:valueStr = name . value
-          endif
-
-          let l:undefined = 0
-          if l:ix < l:countIndices
-            if type(value) == v:t_string && value == s:VAL_PLACEHOLDER
-              let l:hl = 'stk_even'
-            else
-              let l:threshold = s:stk_config["threshold"]["indices"][ix]
-              if value >= l:threshold
-                let l:hl = 'stk_up_hl'
-              elseif value <= -l:threshold
-                let l:hl = 'stk_down_hl'
-              else
-                let l:undefined = 1
-              endif
-            endif
-          else
-            if value >= s:stk_config["threshold"]["up"]
-              let l:hl = 'stk_up_hl'
-            elseif value <= -s:stk_config["threshold"]["down"]
-              let l:hl = 'stk_down_hl'
-            else
-              let l:undefined = 1
-            endif
-          endif
-
-          if l:undefined
-            if value == 0
-              let l:hl = 'stk_even'
-            elseif value > 0
-              let l:hl = 'stk_up'
-            else
-              let l:hl = 'stk_down'
-            endif
-          endif
-
-          let l:text = l:text . s:CreateText(l:valueStr, l:hl)
-
-          if l:ix < l:countIndices
-            let l:text = l:text . s:CreateText(l:ix == 2 ? s:stk_sep2 : s:stk_sep1, 'stk_even')
-          endif
-
-          let l:ix += 1
-        endfor
-        let g:stk_output = l:text
-      else
-        call s:Log('Prices empty')
-      endif
-    else
-      call s:Log('No "Prices" key, data may be corrupted, or cleared when right open in runner, but here should not be reached, check dataLockFile logics')
-    endif
-  endif
-
-  let l:target_days = 0
-  let l:target_hour = 0
-  if s:InRestDay()
-    let l:target_days = s:FindNextOpenDay()
-  else
-    let l:timehour = strftime("%H%M%S") "Consistent with stocker_runner `datetime.now().time()`
-    if l:timehour < "091500"
-      let l:target_hour = 9
-      let l:target_minute = 15
-    elseif l:timehour > "113000" && l:timehour < "130000"
-      let l:target_hour = 13
-      let l:target_minute = 0
-    elseif l:timehour > "150000"
-      call s:Log('Market closed')
-      let l:target_days = s:FindNextOpenDay()
-    endif
+    call s:Render(l:data)
   endif
 
-  if l:target_days
-    let l:min = (24 * l:target_days - str2nr(strftime("%H"))) * 60 - str2nr(strftime("%M"))
-    let l:min += 9 * 60 + 15
-    let s:stk_timer = timer_start(l:min * 60000, 's:StartRunner')
-    call s:Log('Scheduled after ' . l:target_days . ' day(s) [' . strftime("%Y-%m-%d %a", localtime() + l:target_days * 86400) . ']')
-  elseif l:target_hour
-    let l:current_hour = str2nr(strftime("%H"))
-    let l:current_minute = str2nr(strftime("%M"))
-    let l:min = (l:target_hour - l:current_hour) * 60 + (l:target_minute - l:current_minute)
-    let s:stk_timer = timer_start(l:min * 60000, 's:StartRunner')
-
-    let l:hour = l:min / 60
-    let l:min = l:min % 60
-    call s:Log('Scheduled after ' . l:hour . ':' . l:min)
+  let l:closed = !py3eval('tradecal.inSession()')
+  if l:closed
+    let l:open = s:NextOpen()
+    "A minute early, the runner warms up connections before the session
+    let l:wake = l:open - 60 > localtime() ? l:open - 60 : l:open
+    let s:stk_timer = timer_start((l:wake - localtime()) * 1000, 's:StartRunner')
+    call s:Log('Scheduled at ' . strftime("%Y-%m-%d %a %H:%M:%S", l:wake))
+  elseif s:Subscribe()
+    "Quotes are pushed, the timer only watches over the runner
+    let s:stk_timer = timer_start(s:stk_watchdog, 's:DisplayPrices')
   else
     let s:stk_timer = timer_start(s:stk_delay, 's:DisplayPrices')
   endif
 
   "Display a correct one before quit
-  "echom 'aaaa' . (l:target_days || l:target_hour)
+  "echom 'aaaa' . l:closed
   "echom 'bbbb' . (!has_key(l:data, 'prices') || type(l:data['prices']) == v:t_string)
   "echom 'cccc' . (s:stk_retry < 3)
-  if (l:target_days || l:target_hour) && (!has_key(l:data, 'prices') || type(l:data['prices']) == v:t_string) && s:stk_retry < 3
+  if l:closed && (!has_key(l:data, 'prices') || type(l:data['prices']) == v:t_string) && s:stk_retry < 3
     call s:Log('Retry ' . s:stk_retry)
     let s:stk_retry += 1
     let s:stk_timer = timer_start(s:stk_delay, 's:DisplayPrices')
   endif
 endfunction
 
-function! StockRun()
+" a:1 = 1: start a runner regardless of the published data
+function! StockRun(...)
   "call s:Log('StockRun')
   if !s:ReadConfig()
     return
   endif
 
   let l:needRunner = 0
-  let l:timehour = strftime("%H%M")
+  let l:header = s:ReadHeader()
+  let g:stk_last_read_time = localtime()
 
-  if !filereadable(g:stk_data_path) || getfsize(g:stk_data_path) == 0
+  if (a:0 && a:1) || empty(l:header) || l:header['seq'] == 0
     let l:needRunner = 1
   else
-    let l:data_modified_time = getftime(g:stk_data_path)
-    let g:stk_last_read_time = localtime()
+    let l:data_modified_time = float2nr(l:header['ts'])
     "call s:Log('StockRun g:stk_last_read_time: ' . string(g:stk_last_read_time))
 
     if getftime(s:stk_config_path) > l:data_modified_time
       let l:needRunner = 1
     else
-      let l:today_start = luaeval('GetMidnight()')
-      if s:InRestDay()
-        "strptime is not available on windows
-        "Simpler way to ensure it's the latest
-        if l:data_modified_time < l:today_start
-          "call s:Log('data modified time: ' . l:data_modified_time . ' today start: ' . l:today_start)
-          let l:needRunner = 1
-        endif
+      if py3eval('tradecal.inSession()')
+        let l:needRunner = !s:CheckRunner(0)
       else
-        let l:timehour = strftime("%H%M%S")
-        if l:timehour < "091500"
-          if l:data_modified_time < l:today_start
-            let l:needRunner = 1
-          endif
-        elseif l:timehour >= "113000" && l:timehour < "130000"
-          if l:data_modified_time < l:today_start + 11 * 3600 + 30 * 60
-            let l:needRunner = 1
-          endif
-        elseif l:timehour >= "150000"
-          if l:data_modified_time < l:today_start + 15 * 3600
-            let l:needRunner = 1
-          endif
-        else
-          "Trading time
-          let l:needRunner = !s:CheckRunner(0)
-        endif
+        "Outside sessions the data only has to be newer than the last close
+        let l:needRunner = l:data_modified_time < float2nr(py3eval('tradecal.lastClose().timestamp()'))
       endif
     endif
   endif
@@ -497,8 +603,11 @@ endfunction
 
 function! StockRefresh()
   "call s:Log('refreshing')
-  call writefile([""], g:stk_data_path, 'b') " prevent newline
-  call StockRun()
+  if !s:CheckRunner(1)
+    "An empty data file makes the runner fetch, even on a rest day
+    call writefile([""], g:stk_data_path, 'b') " prevent newline
+  endif
+  call StockRun(1)
 endfunction
 
 function! StockUpdate()
@@ -516,6 +625,7 @@ function! StockUpdate()
 endfunction
 
 function! StockClean()
+  call s:Unsubscribe()
   lua CloseDataInner()
 endfunction
 
@@ -524,8 +634,24 @@ function! StkCheckWin(str, _)
   return winnr() == 1 ? a:str : ''
 endfunction
 
+function! StkQueryReply(line)
+  let l:reply = json_decode(a:line)
+  call s:Log(has_key(l:reply, 'data') ? string(l:reply['data']) : l:reply['error'])
+endfunction
+
+"No runner to ask, a lean process fetches without blocking the editor
+function! StkQueryFallback(query)
+  call jobstart(['python', s:stk_query_path, a:query], {
+        \ 'stdout_buffered': v:true,
+        \ 'on_stdout': {j, d, e -> s:Log(join(d, ''))}
+        \ })
+endfunction
+
 function! StockPrices()
-  call s:Log(system("python " . s:stk_runner_path . ' price')[:-2])
+  "The runner may fetch for up to "delay" seconds, one more for hedged requests
+  if !luaeval('QueryRunner(_A[1], _A[2], _A[3])', ['price', s:stk_query_addr_path, s:stk_delay + 1000])
+    call StkQueryFallback('price')
+  endif
 endfunction
 
 function! LualineFromStock()
@@ -0,0 +1,83 @@
+import json
+import os
+import socket
+import sys
+
+# One-shot queries for the editor, see answerQuery in stock_runner.py:
+#   python stock_query.py price|quotes|<server index>
+# A running runner answers from memory. Without one, prices are fetched
+# here with only what a fetch needs imported, no toasts, no numpy.
+
+folder = os.path.expanduser("~/.stock")
+configFile = f"{folder}/cfg/stock.cfg.json"
+queryAddrFile = f"{folder}/stock.query.addr"
+statsFile = f"{folder}/stock.stats.json"
+symbolsFile = f"{folder}/symbols.json"
+TIMEOUT = 3
+
+
+def ask(query):
+    if not os.path.exists(queryAddrFile):
+        return None
+    with open(queryAddrFile, "r", encoding="utf-8") as f:
+        mode, address = f.read().split()
+    try:
+        if mode == "pipe":
+            conn = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        else:
+            host, port = address.rsplit(":", 1)
+            conn = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            address = (host, int(port))
+        with conn:
+            conn.settimeout(TIMEOUT)
+            conn.connect(address)
+            conn.sendall(f"{query}\n".encode("utf-8"))
+            reply = json.loads(conn.makefile("r", encoding="utf-8").readline())
+    except (OSError, ValueError):
+        return None  # Runner gone, the address file is stale
+    return reply.get("data", reply.get("error"))
+
+
+def fetch(query):
+    from servers import Servers
+    import quotes
+    import scheduler
+    import sessions
+    import symbols
+
+    with open(configFile, "r", encoding="utf-8") as f:
+        config = json.load(f)
+    symbols.load(symbolsFile)
+    keys = symbols.resolve(config["indices"], config["codes"], Servers)
+    if query.isdigit():
+        server, price_mode = Servers[int(query)], None
+    else:
+        scheduler.load(statsFile)
+        server, price_mode = scheduler.pick([s for s in Servers if s["has_price"]])[0], True
+
+    table = quotes.QuoteTable(server["codes"], short=server["has_price"])
+    size = server["max_symbols"]
+    for i in range(0, len(server["codes"]), size):
+        codes = server["codes"][i:i + size]
+        view = dict(server, codes=codes, codes_str=",".join(codes))
+        try:
+            rsp = sessions.get(view).get(view["url_formatter"](view["codes_str"]), timeout=config["delay"])
+            if rsp.status_code != 200:
+                return str(rsp.status_code)
+            view["rsp_bytes_parser" if view["bytes_faster"] else "rsp_parser"](rsp, view, price_mode, table, i)
+        except Exception as er:
+            return repr(er)
+    table.rename(symbols.fill(keys, table.names))  # As the runner shows them
+    return table.rows()
+
+
+def main(query):
+    data = ask(query)
+    if data is None and query != "quotes":
+        data = fetch(query)
+    return data
+
+
+if __name__ == "__main__":
+    sys.stdout.reconfigure(encoding="utf-8")
+    print(main(sys.argv[1] if len(sys.argv) > 1 else "price"))
@@ -5,38 +5,77 @@ import json
 import time
 import traceback
 import atexit
-from datetime import datetime
-import random
-import requests
+from datetime import datetime, timedelta
+import threading
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, as_completed, TimeoutError as FutureTimeout
 from requests.exceptions import Timeout
-import errno
-from windows_toasts import Toast, WindowsToaster, ToastDisplayImage
 
-from servers import Servers, NAME_PLACEHOLDER
-
-sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
+from servers import Servers
+import sessions
+import scheduler
+import snapshot
+import quotebuf
+import pubsub
+import ticks
+import analytics
+import rules
+import symbols
+import cadence
+import profiles
+import metrics
+import notify
+import tradecal
+import recorder
+import quotes
 
 folder = os.path.expanduser("~/.stock")
 configFile = f"{folder}/cfg/stock.cfg.json"
+daemonFile = f"{folder}/daemon.json"
 dataFile = f"{folder}/stock.dat.json"
-dataLockFile = f"{folder}/stock.dat.lock"
+shmFile = f"{folder}/stock.dat.shm"
+pubSockFile = f"{folder}/stock.pub.sock"
+pubAddrFile = f"{folder}/stock.pub.addr"
+querySockFile = f"{folder}/stock.query.sock"
+queryAddrFile = f"{folder}/stock.query.addr"
 pidFile = f"{folder}/stock.runner.pid"
 logFile = f"{folder}/stock.log"
-ONCE_MODE = len(sys.argv) > 1
+statsFile = f"{folder}/stock.stats.json"
+metricsFile = f"{folder}/stock.metrics.prom"
+staleFile = f"{folder}/stock.stale.log"
+symbolsFile = f"{folder}/symbols.json"
+calendarFile = f"{folder}/calendar.json"
+ticksFolder = f"{folder}/ticks"
+recordsFolder = f"{folder}/records"
+DAEMON_MODE = len(sys.argv) > 1 and sys.argv[1] == "daemon"
+ONCE_MODE = len(sys.argv) > 1 and not DAEMON_MODE
 
 Pid = os.getpid()
 
-Cfg_reading = False
 Cfg_ts = None
 Config = {}
-Rests = []
 OneObserver = None
+ConfigChanged = threading.Event()
 Notified = []
 JsonData = None
 FirstRun = True
 Server = None
-Names = None
-ContiguousRetry = 0
+Keys = []
+Hedger = None
+Chunker = None
+Quotes = None
+Publisher = None
+Responder = None
+PriceCache = None  # (ts, prices) of the last price query
+PriceLock = threading.Lock()
+Ticks = None
+Rolling = None
+Rules = None
+Snapshot = None
+LastDate = None
+Groups = []
+Generation = 0  # Bumped when the config needs the groups built again
+Latest = None  # quotes.QuoteTable of all groups, in Keys order
 
 
 def truncate_if_large(file_path, max_size=2 * 1024 * 1024, keep_lines=100):
@@ -90,64 +129,198 @@ def global_exception_handler(exctype, value, tb):
     sys.__excepthook__(exctype, value, tb)
 
 
+# One-shot queries of stock_query.py, answered from memory where possible:
+#   quotes  the merged quotes as published
+#   price   prices from a provider having them, cached for "query_ttl" seconds
+#   <n>     a fetch from Servers[n], to test a provider
+def answerQuery(query):
+    global PriceCache
+    metrics.inc("stock_queries_total", query="server" if query.isdigit() else query)
+    if query == "quotes":
+        return (JsonData or {}).get("prices")
+    if query.isdigit():
+        return fetchFrom(ownTable(Servers[int(query)]), None, True).published()
+    if query != "price":
+        raise ValueError(f"Unknown query: {query}")
+    with PriceLock:  # Queries at the same time share a fetch
+        if PriceCache and time.time() - PriceCache[0] < Config.get("query_ttl", 10):
+            return PriceCache[1]
+        server = scheduler.pick([s for s in Servers if s["has_price"]])[0]
+        prices = fetchFrom(ownTable(server), True)
+        if prices.error is not None:
+            return prices.error
+        prices.rename(symbols.fill(Keys, prices.names))  # As the ticks show them
+        PriceCache = (time.time(), prices.rows())
+        return PriceCache[1]
+
+
+# Values read at export time
+def gauges():
+    stale = 0
+    if os.path.exists(staleFile):  # Appended by editors finding data stale
+        with open(staleFile, "rb") as f:
+            stale = f.read().count(b"\n")
+    return {
+        "stock_symbols": len(Keys),
+        "stock_subscribers": len(Publisher.subscribers) if Publisher else 0,
+        "stock_notifications_dropped": notify.Dropped,
+        "stock_vim_stale_total": stale,
+    }
+
+
 def cleanup():
+    notify.close()
+    if Responder:
+        Responder.close()
+    if Snapshot:  # A session ran
+        log(f"Session metrics: {metrics.summary()}")
+        metrics.write(metricsFile, gauges, True)
+    metrics.close()
+    if OneObserver:
+        OneObserver.stop()
+    if Publisher:
+        Publisher.close()
+    if Ticks:
+        Ticks.close()
+    recorder.close()
+    scheduler.save(statsFile, True)
+    sessions.closeAll()
+    profiles.closeAll()
     LogFileHandle.close()
-    os.remove(pidFile)
+    if not DAEMON_MODE and os.path.exists(pidFile):  # Profiles remove their own
+        os.remove(pidFile)
+
+
+def configMtime():
+    if DAEMON_MODE:
+        return max(os.path.getmtime(daemonFile), profiles.mtime())
+    return os.path.getmtime(configFile)
+
+
+# Top level keys whose values differ, "watchlist" if indices or codes do
+def diffConfig(old, new):
+    changed = {k for k in old.keys() | new.keys() if old.get(k) != new.get(k)}
+    if changed & {"indices", "codes"}:
+        changed -= {"indices", "codes"}
+        changed.add("watchlist")
+    return changed
+
+
+# Moves per symbol state to the positions of `keys`, dropping removed ones
+def remapState(keys):
+    global Rolling
+    positions = {k: i for i, k in enumerate(keys)}
+    fired = [positions[Keys[i]] for i in Notified if i < len(Keys) and Keys[i] in positions]
+    Notified[:] = sorted(fired)
+    if Rolling:
+        Rolling.remap(keys)
 
 
 def readConfig():
-    global Cfg_reading, Cfg_ts, Config, Rests, Notified, JsonData, Names, FirstRun
-    Cfg_reading = True
-
-    with open(configFile, "r", encoding="utf-8") as f:
-        try:
-            Config = json.load(f)
-        except Exception:
-            traceback.print_exc(file=logFile)
-            return
+    global Cfg_ts, Config, FirstRun, Keys, Rules
 
-    if len(Config["threshold"]["indices"]) != len(Config["indices"]):
+    reloading = bool(Keys)
+    Cfg_ts = configMtime()
+    try:
+        if DAEMON_MODE:
+            config = profiles.load(daemonFile, log)
+            if config is None:
+                log("No profiles to serve.")
+                return
+        else:
+            with open(configFile, "r", encoding="utf-8") as f:
+                config = json.load(f)
+    except Exception:
+        log(traceback.format_exc())
+        return
+
+    if len(config["threshold"]["indices"]) != len(config["indices"]):
         log("Indices and thresholds mismatch.")
         return
 
-    if len(Config["indices"]):
-        for server in Servers:
-            server["codes"] = [
-                server["code_converter"](i, True) for i in Config["indices"]
-            ]
-    else:
+    if not len(config["indices"]):
         log("No indices configured.")
         return
 
-    if len(Config["codes"]):
-        for server in Servers:
-            server["codes"] += [server["code_converter"](i) for i in Config["codes"]]
-            server["codes_str"] = ",".join(server["codes"])
-    else:
+    if not len(config["codes"]):
         log("No codes configured.")
 
-    if not len(Servers[0]["codes"]):
-        raise Exception("No indices and codes configured.")
-
-    Rests = Config["rest_dates"]
-    if JsonData:  # Config changed on the fly
-        FirstRun = True
-        Names = None
-        Notified.clear()
-
-    Cfg_ts = os.path.getmtime(configFile)
-    Cfg_reading = False
+    changed = diffConfig(Config, config)
+    if "watchlist" in changed:
+        if not symbols.Index:
+            symbols.load(symbolsFile)
+        keys = symbols.resolve(config["indices"], config["codes"], Servers)
+        symbols.save()
+        if not len(keys):
+            raise Exception("No indices and codes configured.")
+        for server in Servers:
+            server["codes_str"] = ",".join(server["codes"])
+            size = server["max_symbols"]
+            server["chunks"] = [
+                server["codes"][i:i + size] for i in range(0, len(server["codes"]), size)
+            ]
+            server["table"] = quotes.QuoteTable(keys, short=server["has_price"])
+        if reloading:
+            remapState(keys)
+        Keys = keys
+        # Full data first only while some names were never seen
+        FirstRun = not symbols.known(Keys)
+
+    Config = config
+    if changed & {"watchlist", "rest_dates", "sessions"}:
+        tradecal.load(
+            calendarFile,
+            Config["rest_dates"],
+            Config.get("sessions"),
+            tradecal.markets(Config["indices"]),
+        )
+    if "budgets" in changed:
+        cadence.setup(Config.get("budgets", {}))
+    if "notify" in changed and reloading:
+        for error in notify.setup(Config.get("notify", {}), folder):
+            log(f"Notification sink skipped, {error}")
+    if changed & {"watchlist", "indices", "threshold", "rules"}:
+        Rules = None  # Compiled again from Notified
+    if reloading and changed:
+        log(f"Config changes: {sorted(changed)}")
+    return changed or True
+
+
+# Sets ConfigChanged on writes to the config, False without watchdog
+def watchConfig():
+    global OneObserver
+    if DAEMON_MODE:
+        return False  # Profiles live in several folders, polled instead
+    try:
+        from watchdog.observers import Observer
+        from watchdog.events import FileSystemEventHandler
+    except ImportError:
+        return False
+
+    target = os.path.normcase(os.path.abspath(configFile))
+
+    class Handler(FileSystemEventHandler):
+        def on_any_event(self, event):
+            if event.event_type not in ("modified", "created", "moved"):
+                return  # Opening or reading it, the runner's own reads included
+            for path in (event.src_path, getattr(event, "dest_path", "")):
+                if path and os.path.normcase(os.path.abspath(path)) == target:
+                    ConfigChanged.set()
+
+    OneObserver = Observer()
+    OneObserver.schedule(Handler(), os.path.dirname(target))
+    OneObserver.start()
     return True
 
 
-def chooseServer(test_server_index, price_mode):
+def chooseServer(test_server_index, price_mode, count=1):
     global FirstRun, Server
     if test_server_index is not None:
         Server = Servers[test_server_index]
     else:
         if FirstRun:
             FirstRun = False
-            Server = Servers[0]  # The first one returns full data
+            Server = next(s for s in Servers if s["has_name"])  # Returns full data
         else:
             if price_mode:
                 servers = [
@@ -155,267 +328,598 @@ def chooseServer(test_server_index, price_mode):
                 ]  # Custom condition
             else:
                 servers = Servers
-            Server = random.choice(servers)
-
-
-# last_ts = round(time.time() * 1000)
-def retrieveStockData():
-    # global last_ts
-    global FirstRun, Server
-    test_server_index = None
-    price_mode = None
-    if ONCE_MODE:
-        if sys.argv[1].isdigit():
-            test_server_index = int(sys.argv[1])
-        else:
-            price_mode = True
-
-    chooseServer(test_server_index, price_mode)
-
+            servers = scheduler.pick(servers, count)
+            if count > 1:
+                return servers
+            Server = servers[0]
+    return [Server]
+
+
+# A copy of `server` filling a table of its own, for fetches outside the ticks
+def ownTable(server):
+    return dict(server, table=quotes.QuoteTable(server["table"].keys, short=server["has_price"]))
+
+
+# A table of `server` keys holding only `error`
+def failedTable(server, error):
+    table = quotes.QuoteTable(server["table"].keys)
+    table.error = error
+    return table
+
+
+# Fills the table of `server` in place and returns it, `error` set on failure
+def fetchFrom(server, price_mode, verbose=False, cancelled=None):
+    global Chunker
+    table = server["table"]
+    chunks = server["chunks"]
+    if len(chunks) == 1:
+        table.error = fetchChunk(server, price_mode, table, 0, verbose, cancelled)
+        return table
+
+    if Chunker is None:
+        Chunker = ThreadPoolExecutor(
+            max_workers=Config.get("pool_size", sessions.POOL_SIZE),
+            thread_name_prefix="chunk",
+        )
+    views = [dict(server, codes=codes, codes_str=",".join(codes)) for codes in chunks]
+    size = server["max_symbols"]
+    futures = [  # Each chunk fills its own slots
+        Chunker.submit(fetchChunk, view, price_mode, table, i * size, verbose, cancelled)
+        for i, view in enumerate(views)
+    ]
+    table.error = None
+    for future in futures:
+        error = future.result()
+        if error is not None:
+            for rest in futures:
+                rest.cancel()
+            table.error = error
+            return table
+    stamps = [view.get("source_ts") for view in views]
+    server["source_ts"] = None if None in stamps else max(stamps)
+    return table
+
+
+# Fills the slots of `table` from `offset`, returns an error message or None
+def fetchChunk(server, price_mode, table, offset, verbose=False, cancelled=None):
     # import pdb; pdb.set_trace()
-    url = Server["url_formatter"](Server["codes_str"])
+    url = server["url_formatter"](server["codes_str"])
     try:
         start_ts = round(time.time() * 1000)
-        if test_server_index is not None:
+        if verbose:
             log(f"Retrieve from ({start_ts}): {url}")
-        rsp = requests.get(
-            url,
-            timeout=Config["delay"],
-            headers={
-                **Server["headers"],
-                "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
-            },
-        )
+        rsp = sessions.get(server).get(url, timeout=Config["delay"])
         # this_ts = round(time.time() * 1000)
         # log(f'roundtrip ({this_ts}): {this_ts - start_ts}, between: {this_ts - last_ts}')
         # last_ts = this_ts
         # log(rsp.text)
+        latency = round(time.time() * 1000) - start_ts
+        metrics.observe("stock_fetch_seconds", latency / 1000, provider=server["name"])
+        if recorder.Active:
+            recorder.record(server, start_ts, latency, rsp)
         if rsp.status_code != 200:
+            metrics.inc("stock_requests_total", provider=server["name"], outcome="http")
+            scheduler.record(server["name"], latency, "http")
             log(f"Failed to retrieve from ({url}): {rsp.status_code}")
             return str(rsp.status_code)
     except Timeout:
-        msg = f"Request to {url} timed out ({round(time.time() * 1000) - start_ts})."
+        latency = round(time.time() * 1000) - start_ts
+        metrics.inc("stock_requests_total", provider=server["name"], outcome="timeout")
+        scheduler.record(server["name"], latency, "http")
+        msg = f"Request to {url} timed out ({latency})."
         log(msg)
+        if recorder.Active:
+            recorder.record(server, start_ts, latency, error="timeout")
         return msg
     except Exception as er:
+        metrics.inc("stock_requests_total", provider=server["name"], outcome="error")
+        scheduler.record(server["name"], None, "http")
+        if recorder.Active:
+            recorder.record(server, start_ts, None, error=repr(er))
         log(f"Failed to retrieve from {url}: {repr(er)}")
         return repr(er)
 
+    if cancelled is not None and cancelled.is_set():  # Lost the race
+        metrics.inc("stock_requests_total", provider=server["name"], outcome="cancelled")
+        scheduler.record(server["name"], latency, "ok")
+        return "cancelled"
+
     try:
-        data = Server["rsp_parser"](rsp, Server, price_mode)
-        if Server["has_price"]:
-            for i, (name, _) in enumerate(data):
-                data[i][0] = name[0:2].replace(" ", "")
+        parser = "rsp_bytes_parser" if Config.get("bytes_parser", server["bytes_faster"]) else "rsp_parser"
+        parse_start = time.perf_counter()
+        count = server[parser](rsp, server, price_mode, table, offset)
+        metrics.observe("stock_parse_seconds", time.perf_counter() - parse_start, provider=server["name"])
+        if count != len(server["codes"]):  # A body cut short still parses
+            raise ValueError(f"{count} quotes for {len(server['codes'])} symbols")
         # import pdb; pdb.set_trace()
-        # log(f"Parsed: {json.dumps(data)}")
-        return data
+        # log(f"Parsed: {table}")
+        metrics.inc("stock_requests_total", provider=server["name"], outcome="ok")
+        scheduler.record(server["name"], latency, "ok")
+        return None
     except Exception as er:
         # import pdb; pdb.set_trace()
+        metrics.inc("stock_requests_total", provider=server["name"], outcome="parse")
+        scheduler.record(server["name"], latency, "parse")
         log(f"Failed to parse response from {url}: {repr(er)}")
         return repr(er)
 
 
+# Race the same request on several servers, the first clean parse wins
+def hedgedFetch(servers, price_mode):
+    global Hedger
+    if Hedger is None:
+        Hedger = ThreadPoolExecutor(max_workers=len(Servers), thread_name_prefix="hedge")
+
+    cancelled = threading.Event()
+    futures = {
+        Hedger.submit(fetchFrom, server, price_mode, False, cancelled): server
+        for server in servers
+    }
+    error = None
+    try:
+        for future in as_completed(futures, timeout=Config["delay"] + 1):
+            data = future.result()
+            if data.error is None:
+                return data, futures[future]
+            error = data.error
+    except FutureTimeout:
+        error = f"Hedged requests timed out ({len(servers)} servers)."
+        log(error)
+    finally:
+        # Queued ones are dropped, in-flight ones skip parsing
+        cancelled.set()
+        for future, server in futures.items():
+            if future.cancel():  # Never started, nothing recorded for it
+                scheduler.release(server["name"])
+    # Losers may still fill their tables, the error gets one of its own
+    return failedTable(servers[0], error), servers[0]
+
+
+# last_ts = round(time.time() * 1000)
+def retrieveStockData():
+    global Server  # , last_ts
+    test_server_index = None
+    price_mode = None
+    if ONCE_MODE:
+        if sys.argv[1].isdigit():
+            test_server_index = int(sys.argv[1])
+        else:
+            price_mode = True
+
+    servers = chooseServer(test_server_index, price_mode, Config.get("hedge", 1))
+    if len(servers) > 1:
+        data, Server = hedgedFetch(servers, price_mode)
+        return data
+
+    return fetchFrom(Server, price_mode, test_server_index is not None)
+
+
+# Polling groups of the config, the keys no group claims poll at "delay":
+#   "groups": [{"name": "indices", "indices": true, "delay": 2},
+#              {"name": "hot", "codes": ["600519"], "delay": 3}]
+def buildGroups():
+    global Groups, Latest
+    positions = {k: i for i, k in enumerate(Keys)}
+    claimed = set()
+    groups = []
+    for i, cfg in enumerate(Config.get("groups", [])):
+        picked = list(range(len(Config["indices"]))) if cfg.get("indices") else []
+        for code in cfg.get("codes", []):
+            ix = positions.get(code, positions.get(symbols.key(code, True)))
+            if ix is not None:
+                picked.append(ix)
+        picked = sorted(set(picked) - claimed)
+        if picked:
+            claimed.update(picked)
+            groups.append({"name": cfg.get("name", str(i)), "delay": cfg["delay"], "positions": picked})
+    rest = [i for i in range(len(Keys)) if i not in claimed]
+    if rest:
+        groups.append({"name": "default", "delay": Config["delay"], "positions": rest})
+
+    for group in groups:
+        group["keys"] = [Keys[i] for i in group["positions"]]
+        group["generation"] = Generation
+        group["cadence"] = cadence.Controller(group["delay"], Config["cadence"]) if "cadence" in Config else None
+        group["views"] = {}
+        for server in Servers:
+            codes = [server["codes"][i] for i in group["positions"]]
+            size = server["max_symbols"]
+            group["views"][server["name"]] = dict(
+                server,
+                codes=codes,
+                codes_str=",".join(codes),
+                chunks=[codes[i:i + size] for i in range(0, len(codes), size)],
+                table=quotes.QuoteTable(group["keys"], short=server["has_price"]),
+            )
+
+    # Quotes of kept keys stay until their group fetches again
+    old = Latest
+    Latest = quotes.QuoteTable(list(Keys), symbols.names(Keys))
+    if old is not None:
+        Latest.carry(old)
+    Groups = groups
+    return groups
+
+
+# Runs in a worker thread, returns the quotes of a group and their server
+def fetchGroup(group):
+    # Any server returning full data while names are unknown, failover included
+    pool = Servers if symbols.known(group["keys"]) else [s for s in Servers if s["has_name"]]
+    # Requests of each server, those with fewer symbols per request need more
+    needed = {name: len(view["chunks"]) for name, view in group["views"].items()}
+    if "cadence" in Config or "budgets" in Config:
+        while True:  # Only servers with budget left for the whole group
+            ready, wait = cadence.ready(pool, needed)
+            if ready:
+                pool = ready
+                break
+            time.sleep(wait)
+    servers = scheduler.pick(pool, Config.get("hedge", 1))
+    for server in servers:
+        cadence.take(server["name"], needed[server["name"]])
+    views = [group["views"][s["name"]] for s in servers]
+    if len(views) > 1:
+        return hedgedFetch(views, None)
+    return fetchFrom(views[0], None), views[0]
+
+
+# Names of a group come to Latest from symbols, see mergeGroup
+def fillNames(table, group=None):
+    if Server["has_name"]:
+        symbols.learn(group["keys"] if group else Keys, table.names)
+    elif group is None:
+        table.rename(symbols.names(Keys))
+
+
+# False when the exchange time of a response is not newer than the quotes
+# held for the group, providers not stamping quotes are always fresh
+def isFresh(group, server, prices):
+    ts = server.get("source_ts") if prices.error is None else None
+    held = group.get("source_ts")
+    if ts is None or held is None or ts > held:
+        if ts is not None:
+            group["source_ts"] = ts
+            scheduler.stale(server["name"], False)
+        return True
+    if ts < held:
+        metrics.inc("stock_stale_total", provider=server["name"])
+        if scheduler.stale(server["name"]):
+            log(f"{server['name']} serves stale quotes, {held - ts:.0f}s behind")
+    else:
+        metrics.inc("stock_unchanged_total", provider=server["name"])
+    return False
+
+
+# Merged quotes after a group fetched, None to skip publishing
+def mergeGroup(group, prices):
+    if prices.error is not None:
+        if len(group["positions"]) == len(Keys):
+            return prices  # Nothing else to show
+        log(f"Group {group['name']} failed: {prices.error}")
+        return None
+    fillNames(prices, group)
+    Latest.merge(prices, group["positions"])  # snapshot.Writer keeps a copy
+    Latest.rename(symbols.names(Keys))
+    return Latest
+
+
 def checkNotify(data):
-    txts = []
-    up = False
-    down = False
-    for i, (name, value) in enumerate(data):
-        if value is None:  # ???????
-            url = Server["url_formatter"](Server["codes_str"])
-            error = f"{name} has no value:\n{url}\n{str(data)}"
-            error = f"<{Server['headers']['Referer']}>\n{error}"
-            toast(error)
-            log(error)
-            continue
-        if i in Notified:
+    global Rules
+    if Rules is None:
+        Rules = rules.Engine(Config, Keys, Notified)
+
+    for i in data.missing():  # ???????
+        url = Server["url_formatter"](Server["codes_str"])
+        error = f"{data.names[i]} has no value:\n{url}\n{str(data)}"
+        error = f"<{Server['headers']['Referer']}>\n{error}"
+        toast(error)
+        log(error)
+
+    alerts = Rules.evaluate(data)
+    notified = Rules.notified()
+    if notified != Notified:  # Kept in place, it is the published list
+        Notified[:] = notified
+    if alerts:
+        metrics.inc("stock_alerts_total", len(alerts))
+        alert(data, alerts)
+
+
+# rules.CLASSES of the quotes, classified once here rather than by editors
+def highlights(prices):
+    global Rules
+    if Rules is None:
+        Rules = rules.Engine(Config, Keys, Notified)
+    return Rules.classes(prices)
+
+
+# Toasts [(index, direction)] alerts of `data`, of a profile in daemon mode
+def alert(data, alerts, profile=None):
+    prefix = f"[{profile}] " if profile else ""
+    txts = [f"{prefix}{data[i][0]}: {data[i][1]}" for (i, _) in alerts]
+    up = any(d == rules.UP for (_, d) in alerts)
+    down = any(d == rules.DOWN for (_, d) in alerts)
+    if up and down:
+        img = "updown"
+    elif up:
+        img = "up"
+    else:
+        img = "down"
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    img = os.path.join(script_dir, img + ".png")
+    toast(txts, img)
+
+
+# Queued for the notification worker, never waits on a sink
+def toast(txts, img=None):
+    if not notify.send(txts, img):  # Not started, as in once mode
+        log(f"Notification: {txts}")
+
+
+def openQuotes():
+    slots = max(Config.get("shm_slots", quotebuf.CAPACITY), len(Servers[0]["codes"]))
+    return quotebuf.Writer(shmFile, slots)
+
+
+# Appends the moved quotes to the tick file of today
+def recordTicks(prices):
+    global Ticks
+    today = datetime.now().date()
+    if Ticks is None or Ticks.day != today:
+        if Ticks:
+            Ticks.close()
+        Ticks = ticks.Writer(ticksFolder, today)
+        ticks.prune(ticksFolder, Config.get("tick_days", ticks.KEEP_DAYS))
+    Ticks.append(Keys, prices, time.time())
+
+
+# Rolling changes and session extremes, None without numpy
+def updateAnalytics(prices):
+    global Rolling
+    if analytics.numpy is None or not Config.get("analytics", True):
+        return None
+    if Rolling is None:
+        Rolling = analytics.Rolling(Keys, min(g["delay"] for g in Groups))
+    return Rolling.update(prices, time.time())
+
+
+def marketTime():
+    if not tradecal.isOpenDay():
+        log("Rest day, exit. (wake from sleep)")
+        return False
+    return tradecal.inSession()
+
+
+def publishTick(prices, market_time):
+    global LastDate, Rolling
+    if prices.error is None:
+        if LastDate != datetime.now().date():  # The next day starts
+            LastDate = datetime.now().date()
+            Notified.clear()
+            if Rules:
+                Rules.reset()
+            Rolling = None
+        elif market_time:
+            if not DAEMON_MODE:  # Profiles have their own alerts
+                start = time.perf_counter()
+                checkNotify(prices)
+                metrics.observe("stock_alert_seconds", time.perf_counter() - start)
+            start = time.perf_counter()
+            stats = updateAnalytics(prices)
+            if stats:  # Top level lists, deltas then carry only the moved symbols
+                for name, values in stats.items():
+                    JsonData[f"analytics_{name}"] = values
+                metrics.observe("stock_analytics_seconds", time.perf_counter() - start)
+        JsonData["hl"] = highlights(prices)
+
+    JsonData["prices"] = prices.published()
+
+    start = time.perf_counter()
+    record = Snapshot.record(JsonData)
+    if record is None:  # Unchanged, only tell readers the runner is alive
+        Quotes.heartbeat()
+        metrics.inc("stock_ticks_total", changed="no")
+    else:
+        # log(f"Data modified: {record}")
+        Quotes.publish(prices, JsonData.get("hl"))
+        line = Snapshot.write(record, JsonData)
+        metrics.observe("stock_write_seconds", time.perf_counter() - start)
+        metrics.inc("stock_ticks_total", changed="yes")
+        if Publisher:
+            start = time.perf_counter()
+            Publisher.publish(line, Snapshot.seq, Snapshot.data)
+            metrics.observe("stock_publish_seconds", time.perf_counter() - start)
+        if market_time and prices.error is None and Config.get("ticks", True):
+            recordTicks(prices)
+    if DAEMON_MODE:
+        profiles.publish(prices, Keys, market_time, alert)
+
+
+# Fetches a group on deadlines `delay` apart, until the market closes
+async def pollGroup(group):
+    global Server
+    loop = asyncio.get_running_loop()
+    deadline = loop.time()
+    retry = 0
+    while True:
+        prices, server = await asyncio.to_thread(fetchGroup, group)
+        if group["generation"] != Generation:  # Keys changed while fetching
+            return
+        scheduler.save(statsFile)
+        symbols.save()
+        metrics.write(metricsFile, gauges)
+        market_time = marketTime()
+        Server = server
+        if isFresh(group, server, prices):
+            merged = mergeGroup(group, prices)
+            if merged is not None:
+                publishTick(merged, market_time)
+        else:  # Nothing newer than what readers have
+            Quotes.heartbeat()
+            if DAEMON_MODE:
+                profiles.heartbeat()
+        if prices.error is not None and retry < 3:
+            retry += 1
+            metrics.inc("stock_retries_total", group=group["name"])
+            log(f"Retry {retry} ({group['name']})")
             continue
-        if type(value) is str:  # '-'
+        retry = 0
+        if not market_time:
+            return
+
+        delay = group["delay"]
+        if group["cadence"] and prices.error is None:
+            headroom = Rules.headroom(prices, group["positions"]) if Rules else float("inf")
+            delay = group["cadence"].update(prices, headroom)
+        deadline += delay
+        now = loop.time()
+        if deadline <= now:  # Overran, skip to the next deadline in phase
+            deadline += ((now - deadline) // delay + 1) * delay
+        await asyncio.sleep(deadline - now)
+
+
+# Returns when the config changed so that groups are built again
+async def awaitRegroup():
+    global Generation
+    while True:
+        await asyncio.sleep(1)
+        if ConfigChanged.is_set() or OneObserver is None and configMtime() > Cfg_ts:
+            ConfigChanged.clear()
+            log("cfg updated")
+            changed = readConfig()
+            if type(changed) is set and changed & {"watchlist", "groups", "delay", "cadence"}:
+                Generation += 1  # Before any group resumes, they run on this loop
+                return
+
+
+async def poll():
+    while True:
+        tasks = [asyncio.create_task(pollGroup(g)) for g in buildGroups()]
+        log(f"Polling groups: {[(g['name'], len(g['keys']), g['delay']) for g in Groups]}")
+        groups = asyncio.gather(*tasks)
+        regroup = asyncio.create_task(awaitRegroup())
+        done, _ = await asyncio.wait({groups, regroup}, return_when=asyncio.FIRST_COMPLETED)
+        if regroup in done:
+            groups.cancel()
+            try:
+                await groups
+            except asyncio.CancelledError:
+                pass
             continue
 
-        if i < len(Config["indices"]):
-            threshold = Config["threshold"]["indices"][i]
-        elif value > 0:
-            threshold = Config["threshold"]["up"]
-        else:
-            threshold = Config["threshold"]["down"]
-
-        if value > 0 and value >= threshold:
-            up = True
-            txts.append(f"{name}: {value}")
-            Notified.append(i)
-        elif value <= 0 and value <= -threshold:
-            down = True
-            txts.append(f"{name}: {value}")
-            Notified.append(i)
-
-    if len(txts):
-        if up and down:
-            img = "updown"
-        elif up:
-            img = "up"
-        elif down:
-            img = "down"
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        img = os.path.join(script_dir, img + ".png")
-        toast(txts, img)
+        regroup.cancel()
+        groups.result()  # Raises what a group raised
+        start = upcomingSession()
+        if not start:
+            log("Market inactive, exit.")
+            return
+        await asyncio.to_thread(warmAndWait, start)
 
 
-def toast(txts, img=None):
-    # import pdb; pdb.set_trace()
-    if type(txts) is str:
-        txts = (txts,)
-    toaster = WindowsToaster("Stock Runner")
-    newToast = Toast()
-    newToast.text_fields = txts
-    # newToast.scenario = ToastScenario.IncomingCall
-    if img:
-        newToast.AddImage(ToastDisplayImage.fromPath(img))
-    toaster.show_toast(newToast)
-
-
-def inRest():
-    today = datetime.now()
-    weekday = today.isoweekday()
-    key = today.strftime("%Y-%m-%d")
-    return weekday > 5 or key in Rests
-
-
-def delDataLockFile():
-    if os.path.exists(dataLockFile):
-        try:
-            os.remove(dataLockFile)
-        except PermissionError as e:
-            if e.errno == errno.EACCES and "used by another process" in str(e):
-                log(f"Runner sync failed.\n Error: {e}")
-
-
-truncate_if_large(logFile)
-LogFileHandle = open(logFile, "a", encoding="utf-8")
-log("Stock runner starting")
-
-if not readConfig():
-    exit(1)
-
-if ONCE_MODE:
-    FirstRun = False
-    log = print
-    print(retrieveStockData())
-    exit(0)
-
-sys.excepthook = global_exception_handler
-atexit.register(cleanup)
-
-if inRest():
-    needRead = True
-
-    if os.path.exists(dataFile) and os.path.getsize(dataFile) > 0:
-        needRead = datetime.fromtimestamp(os.path.getmtime(dataFile)).date() != datetime.now().date()
-
-    if needRead:
-        delDataLockFile()
-        retry = 3
-        while retry:
-            retry -= 1
-            prices = retrieveStockData()
-            if type(prices) is list:
-                break
-        with open(dataLockFile, "w", encoding="utf-8") as fLock, open(
-            dataFile, "w", encoding="utf-8"
-        ) as fData:
-            fData.write(json.dumps({"prices": prices}, ensure_ascii=False))
-            # log("Data updated.")
-    log("Rest day, exit.")
-    sys.exit(0)
-
-# 1 minute buffer in case consumers wake at this minute
-time_start1 = datetime.strptime("9:15", "%H:%M").time()
-time_end1 = datetime.strptime("11:31", "%H:%M").time()
-time_start2 = datetime.strptime("13:00", "%H:%M").time()
-time_end2 = datetime.strptime("15:01", "%H:%M").time()
-
-Data = {}
-if os.path.exists(dataFile):
-    with open(dataFile, "r", encoding="utf-8") as fData:
-        dataStr = fData.read()
-        if dataStr:
-            Data = json.loads(dataStr)
-    data_modified_date = datetime.fromtimestamp(os.path.getmtime(dataFile)).date()
-else:
-    data_modified_date = 0
-
-delDataLockFile()
-
-with open(dataFile, "w", encoding="utf-8") as fData:  # data cleared
-    # log(f'Data opened')
-    time.sleep(1)  # getftime in vim returns seconds
-    with open(dataLockFile, "w", encoding="utf-8") as fLock:
-        if data_modified_date == datetime.now().date() and "notified" in Data:
-            Notified = Data["notified"]
-        JsonData = {"notified": Notified}
-        lastReadDate = datetime.now().date()
-        while True:
-            if Cfg_reading:
-                time.sleep(1)
-                continue
+# The next session start if it is close enough to wait for
+def upcomingSession():
+    now = datetime.now()
+    start = tradecal.nextOpen(now)
+    if (start - now).total_seconds() <= Config.get("warmup", 60):
+        return start
 
-            if os.path.getmtime(configFile) > Cfg_ts:
-                log("cfg updated")
-                readConfig()
 
-            prices = retrieveStockData()
+def sleepUntil(ts):
+    while True:
+        lead = (ts - datetime.now()).total_seconds()
+        if lead <= 0:
+            return
+        time.sleep(min(lead, 10))
+        if Quotes:
+            Quotes.heartbeat()  # Still alive for readers
 
-            market_time = False
-            if inRest():
-                log("Rest day, exit. (wake from sleep)")
-            else:
-                now = datetime.now().time()
-                if (
-                    now >= time_start1
-                    and now <= time_end1
-                    or now >= time_start2
-                    and now <= time_end2
-                ):
-                    market_time = True
-
-            if type(prices) is list:
-                ContiguousRetry = 0
-
-                if Names is None:
-                    Names = [n for (n, _) in prices]
-                elif prices[0][0] == NAME_PLACEHOLDER:
-                    for i, (name, value) in enumerate(prices):
-                        prices[i][0] = Names[i]
-
-                if lastReadDate != datetime.now().date():  # The next day starts
-                    Notified.clear()
-                elif market_time:
-                    checkNotify(prices)
-
-            JsonData["prices"] = prices
-
-            fLock.write(" ")
-            fLock.flush()
-            # log(f"1 lock/data: {datetime.fromtimestamp(os.path.getmtime(dataLockFile)).strftime('%H:%M:%S')}/{datetime.fromtimestamp(os.path.getmtime(dataFile)).strftime('%H:%M:%S')}")
-
-            fData.seek(0)
-            # import pdb; pdb.set_trace()
-            # text = json.dumps(JsonData)
-            # log(f"Data modified: {text}")
-            # fData.write(text)
-
-            fData.write(json.dumps(JsonData, ensure_ascii=False))
-            fData.truncate()
-            fData.flush()
-            # log("Data written")
-            # log(f"2 lock/data: {datetime.fromtimestamp(os.path.getmtime(dataLockFile)).strftime('%H:%M:%S')}/{datetime.fromtimestamp(os.path.getmtime(dataFile)).strftime('%H:%M:%S')}")
-            if type(prices) is str:
-                if ContiguousRetry < 3:
-                    ContiguousRetry += 1
-                    log(f'Retry {ContiguousRetry}')
-                    continue
-
-            if market_time:
-                time.sleep(random.randint(Config["delay"] - 2, Config["delay"]))
-            else:
-                log("Market inactive, exit.")
-                break
+
+def warmAndWait(start):
+    sleepUntil(start - timedelta(seconds=5))
+    errors = sessions.warmUp(Servers)
+    log(f"Connections warmed up{': ' + str(errors) if errors else ''}")
+    sleepUntil(start)
+
+
+if __name__ == "__main__":
+    sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding="utf-8")
+
+    truncate_if_large(logFile)
+    LogFileHandle = open(logFile, "a", encoding="utf-8")
+    log("Stock runner starting")
+
+    if not readConfig():
+        exit(1)
+    sessions.install(Config.get("pool_size", sessions.POOL_SIZE))
+    scheduler.load(statsFile)
+
+    if ONCE_MODE:
+        FirstRun = False
+        log = print
+        print(retrieveStockData())
+        exit(0)
+
+    sys.excepthook = global_exception_handler
+    atexit.register(cleanup)
+    notify.start(Config.get("notify", {}), folder, log)
+    if not watchConfig() and not DAEMON_MODE:
+        log("watchdog not installed, polling the config instead")
+
+    if not tradecal.isOpenDay():
+        needRead = True
+
+        if os.path.exists(dataFile) and os.path.getsize(dataFile) > 0:
+            needRead = datetime.fromtimestamp(os.path.getmtime(dataFile)).date() != datetime.now().date()
+
+        if needRead:
+            retry = 3
+            while retry:
+                retry -= 1
+                prices = retrieveStockData()
+                if prices.error is None:
+                    break
+            hl = None
+            if prices.error is None:
+                fillNames(prices)
+                prices.rename(symbols.names(Keys))  # Any server may answer once names are known
+                symbols.save()
+                hl = highlights(prices)
+            published = prices.published()
+            with open(dataFile, "w", encoding="utf-8") as fData:
+                fData.write(snapshot.dump({"prices": published, "hl": hl} if hl else {"prices": published}))
+                # log("Data updated.")
+            Quotes = openQuotes()
+            Quotes.publish(prices, hl)
+            Quotes.close()
+            if DAEMON_MODE:
+                profiles.publish(prices, Keys, False, alert)
+        log("Rest day, exit.")
+        sys.exit(0)
+
+    Data = {}
+    if os.path.exists(dataFile):
+        with open(dataFile, "r", encoding="utf-8") as fData:
+            dataStr = fData.read()
+            if dataStr:
+                _, Data = snapshot.load(dataStr)
+        data_modified_date = datetime.fromtimestamp(os.path.getmtime(dataFile)).date()
+    else:
+        data_modified_date = 0
+
+    Quotes = openQuotes()
+    truncate_if_large(staleFile, 64 * 1024)
+    if Config.get("metrics_port"):
+        metrics.serve(Config["metrics_port"], gauges)
+    if Config.get("publish", True):
+        Publisher = pubsub.Publisher(pubSockFile, pubAddrFile)
+    Responder = pubsub.Responder(querySockFile, queryAddrFile, answerQuery)
+    if Config.get("record"):
+        log(f"Recording responses to {recorder.start(recordsFolder, Config, Keys)}")
+
+    with open(dataFile, "w", encoding="utf-8") as fData:  # data cleared
+        # log(f'Data opened')
+        if data_modified_date == datetime.now().date() and "notified" in Data:
+            Notified = Data["notified"]
+        JsonData = {"notified": Notified}
+        LastDate = datetime.now().date()
+        Snapshot = snapshot.Writer(fData, Config.get("compact_every", snapshot.COMPACT_EVERY))
+        asyncio.run(poll())
@@ -0,0 +1,105 @@
+import json
+import os
+
+from servers import NAME_PLACEHOLDER
+
+# Symbol master index shared across restarts, keyed like the runner's Keys
+# ("i:000001" for an index, "600519" for a stock):
+#   {key: {"name": "贵州茅台", "exchange": "sh", "providers": {"qq": "sh600519", ...}}}
+# Provider symbols are converted once per key, names are learned from any
+# provider returning them, so no particular provider has to serve first.
+
+Index = {}
+_path = None
+_dirty = False
+_names = None  # Cached names of the last keys asked for
+_names_keys = None
+
+
+def _exchange(qqSymbol):
+    if qqSymbol.startswith("r_hk"):
+        return "hk"
+    return qqSymbol[:2]
+
+
+def load(path):
+    global _path
+    _path = path
+    if not os.path.exists(path):
+        return
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            Index.update(json.load(f))
+    except Exception:
+        pass
+
+
+def save(path=None):
+    global _dirty
+    path = path or _path
+    if not _dirty or not path:
+        return
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(Index, f, ensure_ascii=False)
+    os.replace(tmp, path)
+    _dirty = False
+
+
+def key(code, isIndex=False):
+    return f"i:{code}" if isIndex else code
+
+
+def entry(k, servers):
+    global _dirty
+    item = Index.get(k)
+    if item is None:
+        item = Index[k] = {"name": None, "exchange": None, "providers": {}}
+    providers = item["providers"]
+    isIndex = k.startswith("i:")
+    code = k[2:] if isIndex else k
+    for server in servers:
+        if server["name"] not in providers:
+            providers[server["name"]] = server["code_converter"](code, isIndex)
+            _dirty = True
+    if item["exchange"] is None and "qq" in providers:
+        item["exchange"] = _exchange(providers["qq"])
+    return item
+
+
+# Keys of the watchlist, with `codes` of every server set from the index
+def resolve(indices, codes, servers):
+    keys = [key(i, True) for i in indices] + [key(c) for c in codes]
+    items = [entry(k, servers) for k in keys]
+    for server in servers:
+        name = server["name"]
+        server["codes"] = [item["providers"][name] for item in items]
+    return keys
+
+
+def known(keys):
+    return all(Index[k]["name"] for k in keys)
+
+
+def names(keys):
+    global _names, _names_keys
+    if _names is None or _names_keys != keys:
+        _names = [Index[k]["name"] or NAME_PLACEHOLDER for k in keys]
+        _names_keys = list(keys)
+    return _names
+
+
+# Names of `keys` from the index, the `parsed` ones where it has none
+def fill(keys, parsed):
+    return [name if name != NAME_PLACEHOLDER else own for name, own in zip(names(keys), parsed)]
+
+
+# Remembers the `names` a provider returned for `keys`
+def learn(keys, names):
+    global _dirty, _names
+    for k, name in zip(keys, names):
+        item = Index[k]
+        if name != NAME_PLACEHOLDER and item["name"] != name:
+            item["name"] = name
+            _dirty = True
+            _names = None
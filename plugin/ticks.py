@@ -0,0 +1,132 @@
+import json
+import mmap
+import os
+import struct
+from datetime import datetime, timedelta
+
+import quotes
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# One append-only file per trading day, `YYYY-MM-DD.bin`, of fixed width
+# records: ms since midnight u32, symbol index u32, value f32. Only values
+# that moved since the previous tick are appended. The symbols behind the
+# indices are kept in `YYYY-MM-DD.sym.json`, new ones are added at the end
+# so indices stay valid for the whole day even if the watchlist changes.
+
+RECORD = struct.Struct("<IIf")
+KEEP_DAYS = 30
+
+if numpy:
+    DTYPE = numpy.dtype([("ms", "<u4"), ("sym", "<u4"), ("value", "<f4")])
+
+
+def paths(folder, day):
+    name = os.path.join(folder, day.strftime("%Y-%m-%d"))
+    return name + ".bin", name + ".sym.json"
+
+
+def prune(folder, keep_days=KEEP_DAYS):
+    oldest = (datetime.now() - timedelta(days=keep_days)).strftime("%Y-%m-%d")
+    for name in os.listdir(folder):
+        if name[:10] < oldest and name.endswith((".bin", ".sym.json")):
+            os.remove(os.path.join(folder, name))
+
+
+def _symbols(symFile):
+    if os.path.exists(symFile):
+        with open(symFile, "r", encoding="utf-8") as f:
+            return json.load(f)
+    return []
+
+
+class Writer:
+    def __init__(self, folder, day=None):
+        os.makedirs(folder, exist_ok=True)
+        self.day = day or datetime.now().date()
+        self.path, self.symFile = paths(folder, self.day)
+        self.symbols = _symbols(self.symFile)
+        self.index = {s: i for i, s in enumerate(self.symbols)}
+        self.f = open(self.path, "ab")
+        size = self.f.tell()
+        if size % RECORD.size:  # Torn by a crash
+            self.f.truncate(size - size % RECORD.size)
+        self.last = {}
+        self.midnight = datetime.combine(self.day, datetime.min.time()).timestamp()
+
+    def _indices(self, keys):
+        added = False
+        for key in keys:
+            if key not in self.index:
+                self.index[key] = len(self.symbols)
+                self.symbols.append(key)
+                added = True
+        if added:
+            with open(self.symFile, "w", encoding="utf-8") as f:
+                json.dump(self.symbols, f)
+        return [self.index[k] for k in keys]
+
+    # `keys` name the symbols of the quotes.QuoteTable `table` in order
+    def append(self, keys, table, ts):
+        ms = int((ts - self.midnight) * 1000)
+        indices = self._indices(keys)
+        last = self.last
+        buf = bytearray()
+        for ix, value, state in zip(indices, table.numbers, table.status):
+            if state > quotes.INT or last.get(ix) == value:
+                continue
+            last[ix] = value
+            buf += RECORD.pack(ms, ix, value)
+        if buf:
+            self.f.write(buf)
+            self.f.flush()
+        return len(buf) // RECORD.size
+
+    def close(self):
+        self.f.close()
+
+
+class Reader:
+    def __init__(self, folder, day=None):
+        self.path, self.symFile = paths(folder, day or datetime.now().date())
+        self.symbols = _symbols(self.symFile)
+        self.mm = None
+        self.count = 0
+        if os.path.exists(self.path):
+            with open(self.path, "rb") as f:
+                size = os.fstat(f.fileno()).st_size
+                if size >= RECORD.size:
+                    self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                    self.count = size // RECORD.size
+
+    # All records from `start`, a structured array when numpy is there
+    def records(self, start=0):
+        if self.mm is None:
+            return [] if numpy is None else numpy.empty(0, DTYPE)
+        if numpy:
+            return numpy.frombuffer(self.mm, DTYPE, self.count - start, start * RECORD.size)
+        view = memoryview(self.mm)[start * RECORD.size:self.count * RECORD.size]
+        return list(RECORD.iter_unpack(view))
+
+    # (ms, value) pairs of one symbol, arrays when numpy is there
+    def series(self, key):
+        if key not in self.symbols:
+            return ([], []) if numpy is None else (numpy.empty(0, "<u4"), numpy.empty(0, "<f4"))
+        ix = self.symbols.index(key)
+        records = self.records()
+        if numpy:
+            picked = records[records["sym"] == ix]
+            return picked["ms"], picked["value"]
+        picked = [(ms, v) for (ms, s, v) in records if s == ix]
+        return [ms for ms, _ in picked], [v for _, v in picked]
+
+    def close(self):
+        if self.mm is not None:
+            try:
+                self.mm.close()
+            except BufferError:  # Arrays still viewing it, freed with them
+                pass
+            self.mm = None
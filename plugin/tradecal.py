@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+from datetime import date, datetime, timedelta
+
+# Trading calendar shared by the runner and the editor. Open days of a window
+# around today are built once from "rest_dates" and cached to
+# ~/.stock/calendar.json, with the next and previous open day of every day,
+# so "in session", "next open" and "last close" are lookups. Sessions of a
+# market may be configured, in local time:
+#   "sessions": {"a": [["9:15", "11:31"], ["13:00", "15:01"]], "hk": [...]}
+# A watchlist is in session while any of its markets is.
+
+# 1 minute buffer in case consumers wake at this minute
+SESSIONS = {
+    "a": [["9:15", "11:31"], ["13:00", "15:01"]],
+    "hk": [["9:30", "12:01"], ["13:00", "16:11"]],  # HSI closes with an auction
+}
+BEFORE = 30  # days kept before the day built, long holidays included
+AFTER = 400
+
+_path = None
+_rests = []
+_sessions = SESSIONS
+_markets = ["a"]
+_spans = []  # (start, end) seconds of the day, of all markets
+_base = 0  # Ordinal of the first day
+_open = b""
+_next = []  # Offset of the first open day at or after a day
+_prev = []  # Offset of the last open day at or before a day
+
+
+# Markets of a watchlist, indices like HSI are not A-share ones
+def markets(indices):
+    result = ["a"]
+    if any(not code.isdigit() for code in indices):
+        result.append("hk")
+    return result
+
+
+def _seconds(hm):
+    hour, minute = hm.split(":")
+    return int(hour) * 3600 + int(minute) * 60
+
+
+def _key(rests, sessions):
+    text = json.dumps([sorted(rests), sessions], sort_keys=True)
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def _build(today):
+    global _base, _open, _next, _prev
+    rests = set(_rests)
+    base = today.toordinal() - BEFORE
+    days = [date.fromordinal(base + i) for i in range(BEFORE + AFTER)]
+    is_open = bytes(d.isoweekday() <= 5 and d.isoformat() not in rests for d in days)
+
+    count = len(days)
+    following = [count] * count  # `count` once past the window
+    prev = [-1] * count
+    last = count
+    for i in range(count - 1, -1, -1):
+        if is_open[i]:
+            last = i
+        following[i] = last
+    last = -1
+    for i in range(count):
+        if is_open[i]:
+            last = i
+        prev[i] = last
+    _base, _open, _next, _prev = base, is_open, following, prev
+
+
+def _save(key):
+    if not _path:
+        return
+    data = {"key": key, "base": _base, "open": _open.hex(), "next": _next, "prev": _prev}
+    tmp = _path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(data, f)
+    os.replace(tmp, _path)
+
+
+def _restore(key, today):
+    global _base, _open, _next, _prev
+    if not _path or not os.path.exists(_path):
+        return False
+    try:
+        with open(_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data["key"] != key:
+            return False
+        offset = today.toordinal() - data["base"]
+        if offset < BEFORE or offset >= len(data["next"]) - BEFORE:
+            return False  # Too close to an end of the window
+        _base, _open, _next, _prev = data["base"], bytes.fromhex(data["open"]), data["next"], data["prev"]
+        return True
+    except Exception:
+        return False
+
+
+def load(path, rest_dates, sessions=None, watched=("a",)):
+    global _path, _rests, _sessions, _markets, _spans
+    _path = path
+    _rests = list(rest_dates)
+    _sessions = dict(SESSIONS, **(sessions or {}))
+    _markets = [m for m in watched if m in _sessions] or ["a"]
+    _spans = []
+    for start, end in sorted(
+        (_seconds(start), _seconds(end)) for m in _markets for (start, end) in _sessions[m]
+    ):
+        if _spans and start <= _spans[-1][1]:  # Overlapping sessions of two markets
+            _spans[-1] = (_spans[-1][0], max(end, _spans[-1][1]))
+        else:
+            _spans.append((start, end))
+
+    today = date.today()
+    key = _key(_rests, _sessions)
+    if not _restore(key, today):
+        _build(today)
+        _save(key)
+
+
+def _offset(day):
+    offset = day.toordinal() - _base
+    if not 0 <= offset < len(_open):
+        load(_path, _rests, _sessions, _markets)  # Ran for a long while
+        offset = day.toordinal() - _base
+    return offset
+
+
+def _at(offset, seconds):
+    return datetime.combine(date.fromordinal(_base + offset), datetime.min.time()) + timedelta(seconds=seconds)
+
+
+def isOpenDay(day=None):
+    day = day or date.today()
+    return bool(_open[_offset(day)])
+
+
+def inSession(now=None):
+    now = now or datetime.now()
+    if not _open[_offset(now.date())]:
+        return False
+    seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    return any(start <= seconds <= end for (start, end) in _spans)
+
+
+# Start of the next session after `now`
+def nextOpen(now=None):
+    now = now or datetime.now()
+    offset = _offset(now.date())
+    seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    if _open[offset]:
+        for start, _ in _spans:
+            if start > seconds:
+                return _at(offset, start)
+    return _at(_next[offset + 1] if offset + 1 < len(_next) else len(_next), _spans[0][0])
+
+
+# End of the last session closed by `now`
+def lastClose(now=None):
+    now = now or datetime.now()
+    offset = _offset(now.date())
+    seconds = now.hour * 3600 + now.minute * 60 + now.second + now.microsecond / 1e6
+    if _open[offset]:
+        ends = [end for (_, end) in _spans if end <= seconds]
+        if ends:
+            return _at(offset, max(ends))
+    return _at(_prev[offset - 1] if offset > 0 else -1, max(end for (_, end) in _spans))